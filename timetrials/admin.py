@@ -5,7 +5,8 @@ from django.shortcuts import render
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from timetrials import imports, models, queries
+from timetrials import imports, models, queries, submissions
+from timetrials.models.stats.player_stats import get_active_player_stats_group_id
 
 
 # Filters
@@ -27,16 +28,16 @@ class RecursiveRegionFilter(admin.SimpleListFilter):
         if not region:
             return queryset.none()
 
-        return queryset.filter(region__in=region.descendants(include_self=True).values('pk'))
+        return queryset.filter(region__ancestor_closures__ancestor=region)
 
 
 # Model admins
 
 @admin.register(models.PlayerStatsGroup)
 class PlayerStatsGroupAdmin(admin.ModelAdmin):
-    fields = ('created_at', 'completed')
-    readonly_fields = ('created_at', 'completed')
-    list_display = ('id', 'created_at', 'completed')
+    fields = ('created_at', 'completed', 'is_incremental', 'is_active')
+    readonly_fields = ('created_at', 'completed', 'is_incremental', 'is_active')
+    list_display = ('id', 'created_at', 'completed', 'is_incremental', 'is_active')
 
     def get_deleted_objects(self, objs, request):
         return objs, dict(), set(), list()
@@ -47,10 +48,7 @@ class PlayerStatsInline(admin.TabularInline):
     classes = ['collapse']
 
     def get_queryset(self, request):
-        group = models.PlayerStatsGroup.objects.filter(
-            completed=True
-        ).order_by('-created_at').first()
-        return super().get_queryset(request).filter(group=group)
+        return super().get_queryset(request).filter(group=get_active_player_stats_group_id())
 
     def has_add_permission(self, *args, **kwargs):
         return False
@@ -100,10 +98,26 @@ class PlayerSubmitterAdmin(admin.ModelAdmin):
     ordering = ('player__name', 'submitter__username')
 
 
+@admin.register(models.RegionStatsGroup)
+class RegionStatsGroupAdmin(admin.ModelAdmin):
+    fields = ('created_at', 'completed')
+    readonly_fields = ('created_at', 'completed')
+    list_display = ('id', 'created_at', 'completed')
+
+    def get_deleted_objects(self, objs, request):
+        return objs, dict(), set(), list()
+
+
 class RegionStatsInline(admin.TabularInline):
     model = models.RegionStats
     classes = ['collapse']
 
+    def get_queryset(self, request):
+        group = models.RegionStatsGroup.objects.filter(
+            completed=True
+        ).order_by('-created_at').first()
+        return super().get_queryset(request).filter(group=group)
+
     def has_add_permission(self, *args, **kwargs):
         return False
 
@@ -207,6 +221,12 @@ class ScoreSubmissionAdmin(SubmissionAdmin):
     list_display_links = ('__str__',)
     list_filter = ('status', 'track', 'category', 'is_lap')
     search_fields = ('player__name', 'player__alias')
+    actions = ('accept_submissions',)
+
+    @admin.action(description=_("Accept selected pending submissions"))
+    def accept_submissions(self, request, queryset):
+        accepted = submissions.accept_score_submissions(queryset, reviewed_by=request.user)
+        self.message_user(request, f"Accepted {len(accepted)} submission(s).", messages.SUCCESS)
 
     def change_view(self, request, object_id=None, form_url='', extra_context=None):
         extra_context = extra_context or {}
@@ -0,0 +1,215 @@
+import hashlib
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import resolve
+
+from rest_framework.response import Response
+
+from timetrials import tasks
+from timetrials.models.categories import CategoryChoices
+from timetrials.models.regions import Region, RegionTypeChoices
+from timetrials.models.scores import Score
+
+
+CACHE_TIMEOUT = 60 * 60 * 6
+STALE_TIMEOUT = 60 * 60 * 24
+
+LOCK_TIMEOUT = 30
+LOCK_POLL_INTERVAL = 0.05
+
+PLAYERS_TAG = 'players'
+STANDARDS_TAG = 'standards'
+REGIONS_TAG = 'regions'
+
+
+def track_tag(track_id: int, is_lap: bool, category: CategoryChoices, region_id: int = None):
+    return f'track:{track_id}:{int(is_lap)}:{category}:{region_id or "all"}'
+
+
+def records_tag(category: CategoryChoices, region_id: int = None):
+    return f'records:{category}:{region_id or "all"}'
+
+
+def player_scores_tag(category: CategoryChoices, region_id: int = None):
+    return f'player_scores:{category}:{region_id or "all"}'
+
+
+def region_tag_id(region: Region | None):
+    """Get the region id used in tags, where the world region is the same as no region."""
+    if region is None or region.type == RegionTypeChoices.WORLD:
+        return None
+    return region.pk
+
+
+def tag_version_key(tag: str):
+    return f'tag:{tag}'
+
+
+def get_tag_versions(tags: list[str]) -> list[int]:
+    """Get the current version of each tag, creating versions for tags never seen before."""
+
+    keys = [tag_version_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+
+    missing_versions = {key: time.time_ns() for key in keys if key not in versions}
+    for key, version in missing_versions.items():
+        if not cache.add(key, version, timeout=None):
+            missing_versions[key] = cache.get(key, version)
+
+    return [versions.get(key, missing_versions.get(key)) for key in keys]
+
+
+def invalidate_tags(tags):
+    """
+    Invalidate every cached response with any of the given tags once the current transaction is
+    committed. Versions are timestamps rather than counters so that an evicted version can never
+    be reused by stale responses.
+    """
+
+    def invalidate():
+        version = time.time_ns()
+        cache.set_many({tag_version_key(tag): version for tag in tags}, timeout=None)
+
+    transaction.on_commit(invalidate)
+
+
+def invalidate_score(score: Score):
+    """Invalidate cached responses which may include the given score or depend on its rank."""
+    invalidate_scores([score])
+
+
+def invalidate_scores(scores: list[Score]):
+    """Invalidate cached responses which may include any of the given scores or their ranks."""
+
+    player_region_ids = defaultdict(lambda: [None])
+    for region_id, player_id in Region.objects.filter(
+        descendant_closures__descendant__players__in={score.player_id for score in scores}
+    ).exclude(
+        type=RegionTypeChoices.WORLD
+    ).values_list('pk', 'descendant_closures__descendant__players'):
+        player_region_ids[player_id].append(region_id)
+
+    tags = dict()
+
+    for score in scores:
+        for category in CategoryChoices.values:
+            if category < score.category:
+                continue
+
+            for region_id in player_region_ids[score.player_id]:
+                tags[track_tag(score.track_id, score.is_lap, category, region_id)] = None
+                tags[records_tag(category, region_id)] = None
+                tags[player_scores_tag(category, region_id)] = None
+
+    invalidate_tags(list(tags))
+
+
+class TaggedCacheMixin:
+    """
+    Cache list responses until any of their tags is invalidated. Outdated responses keep being
+    served to every request while a single background task recomputes them, and workers wait for
+    the first one computing a response missing from the cache instead of running the same query.
+    """
+
+    cache_timeout = CACHE_TIMEOUT
+    stale_timeout = STALE_TIMEOUT
+
+    # Standards and the region tree change rarely but may affect every tagged response
+    shared_cache_tags = [STANDARDS_TAG, REGIONS_TAG]
+
+    def get_cache_tags(self) -> list[str]:
+        raise NotImplementedError
+
+    def get_cache_key(self, request):
+        digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return f'response:{self.__class__.__name__}:{digest}'
+
+    def get_tag_versions(self):
+        return get_tag_versions([*self.shared_cache_tags, *self.get_cache_tags()])
+
+    def cache_response(self, key):
+        """Compute the response data and cache it along with the current version of its tags."""
+
+        versions = self.get_tag_versions()
+        data = super().list(self.request, *self.args, **self.kwargs).data
+        cache.set(key, {
+            'data': data,
+            'versions': versions,
+            'expires': time.time() + self.cache_timeout,
+        }, timeout=self.stale_timeout)
+
+        return data
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_cache_key(request)
+        entry = cache.get(key)
+
+        lock_key = f'lock:{key}'
+        lock_token = uuid.uuid4().hex
+
+        if entry is not None:
+            is_fresh = entry['versions'] == self.get_tag_versions()
+            if not (is_fresh and entry['expires'] > time.time()):
+                if cache.add(lock_key, lock_token, timeout=LOCK_TIMEOUT):
+                    tasks.refresh_cached_response.delay(request.get_full_path(), lock_token)
+
+            return Response(entry['data'])
+
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while not cache.add(lock_key, lock_token, timeout=LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                break
+
+            time.sleep(LOCK_POLL_INTERVAL)
+
+            entry = cache.get(key)
+            if entry is not None:
+                return Response(entry['data'])
+
+        try:
+            data = self.cache_response(key)
+
+        finally:
+            if cache.get(lock_key) == lock_token:
+                cache.delete(lock_key)
+
+        return Response(data)
+
+
+def refresh_cached_response(path: str, lock_token: str):
+    """
+    Recompute the cached response of a tagged list view for the given path and query string
+    outside of any request, then release the lock taken by the request which queued it.
+    """
+
+    url = urlsplit(path)
+    match = resolve(url.path)
+
+    http_request = HttpRequest()
+    http_request.method = 'GET'
+    http_request.path = http_request.path_info = url.path
+    http_request.META['QUERY_STRING'] = url.query
+    http_request.GET = QueryDict(url.query)
+
+    view = match.func.view_class(**match.func.view_initkwargs)
+    view.args = match.args
+    view.kwargs = match.kwargs
+    view.request = view.initialize_request(http_request, *match.args, **match.kwargs)
+    view.headers = dict()
+
+    key = view.get_cache_key(view.request)
+    lock_key = f'lock:{key}'
+
+    try:
+        view.initial(view.request, *match.args, **match.kwargs)
+        view.cache_response(key)
+
+    finally:
+        if cache.get(lock_key) == lock_token:
+            cache.delete(lock_key)
@@ -1,6 +1,9 @@
 import datetime
+import operator
+from functools import reduce
+from typing import Callable
 
-from django.db.models import QuerySet
+from django.db.models import Q, QuerySet
 
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
@@ -8,7 +11,7 @@ from rest_framework.exceptions import ValidationError
 
 from timetrials.models.categories import CategoryChoices
 from timetrials.models.players import PlayerAwardTypeChoices
-from timetrials.models.regions import Region, RegionTypeChoices
+from timetrials.models.regions import Region, RegionTypeChoices, get_region_descendant_ids
 from timetrials.models.scores import ScoreSubmissionStatus
 from timetrials.models.stats.region_stats import TopScoreCountChoices
 from timetrials.serializers import CategoryField, ScoreSubmissionStatusField, TopScoreCountField
@@ -37,6 +40,9 @@ class FilterMixin:
 
     def limit(self, queryset: QuerySet) -> QuerySet:
         for filter_field in self.filter_fields:
+            if isinstance(filter_field, CursorFilter):
+                queryset = filter_field.filter(self.request, queryset)
+
             if isinstance(filter_field, OffsetFilter):
                 queryset = filter_field.filter(self.request, queryset)
 
@@ -260,6 +266,90 @@ class LimitFilter(FilterBase):
         )
 
 
+class CursorFilter(FilterBase):
+
+    def __init__(self, *,
+                 fields: dict[str, Callable[[str], object]],
+                 request_field='after',
+                 required=False):
+        """
+        Parameters
+        ----------
+        fields : dict of {str: callable}
+            Mapping of field name to order by, in order, to the function converting the matching
+            cursor value. The last field must be unique so that no two rows have the same cursor.
+        request_field : str
+            The name of the query param of the request to get the filter value from
+        required : bool
+            Whether this filter is required to be present in the query params
+        """
+        super().__init__(
+            field_name='',
+            request_field=request_field,
+            auto=False,
+            required=required
+        )
+
+        self.fields = fields
+
+    def validate_filter_value(self, value: str):
+        # Only the first value may contain commas, e.g. a player name
+        values = value.rsplit(',', len(self.fields) - 1)
+        if len(values) != len(self.fields):
+            self.validation_error('invalid_value', self.request_field, value)
+
+        try:
+            return [convert(value) for convert, value in zip(self.fields.values(), values)]
+
+        except ValueError:
+            self.validation_error('invalid_value', self.request_field, value)
+
+    def filter(self, request, queryset: QuerySet) -> QuerySet:
+        """
+        Order the queryset by the cursor fields and only keep rows ordered after the cursor. When
+        the queryset is annotated with window functions, which would otherwise be calculated over
+        the remaining rows only, the rows up to the cursor are counted and skipped instead.
+        """
+        queryset = queryset.order_by(*self.fields)
+
+        cursor = self.get_filter_value(request)
+        if cursor is None:
+            return queryset
+
+        fields = list(self.fields)
+
+        after_cursor = Q(**{f'{fields[0]}__gte': cursor[0]}) & reduce(
+            operator.or_,
+            (
+                Q(**dict(zip(fields[:index], cursor[:index])), **{
+                    f'{fields[index]}__gt': cursor[index],
+                })
+                for index in range(len(fields))
+            )
+        )
+
+        if any(
+            getattr(annotation, 'contains_over_clause', False)
+            for annotation in queryset.query.annotations.values()
+        ):
+            return queryset[queryset.exclude(after_cursor).count():]
+
+        return queryset.filter(after_cursor)
+
+    @property
+    def open_api_param(self) -> OpenApiParameter:
+        return OpenApiParameter(
+            self.request_field,
+            type=str,
+            required=self.required,
+            allow_blank=False,
+            description=(
+                "Only return rows after the row with the given comma separated values of: "
+                f"{', '.join(self.fields)}."
+            ),
+        )
+
+
 class CategoryFilter(FilterBase):
 
     def __init__(self, *,
@@ -475,10 +565,8 @@ class RegionFilter(FilterBase):
     def filter(self, request, queryset: QuerySet) -> QuerySet:
         if self.expand:
             return queryset.filter(**{
-                f'{self.field_name}__in': (
-                    self.get_filter_value(request).descendants(
-                        include_self=True
-                    ).values_list('pk', flat=True)
+                f'{self.field_name}__in': get_region_descendant_ids(
+                    self.get_filter_value(request)
                 ),
             })
 
@@ -679,12 +767,12 @@ class MetricOrderingFilter(OrderingFilterBase):
                  required=True):
         super().__init__(
             fields={
-                'total_rank': 'total_rank',
-                'total_score': 'total_score',
-                'total_standard': 'total_standard',
-                'total_record_ratio': '-total_record_ratio',
-                'total_records': 'total_records',
-                'leaderboard_points': '-leaderboard_points',
+                'total_rank': 'total_rank_rank',
+                'total_score': 'total_score_rank',
+                'total_standard': 'total_standard_rank',
+                'total_record_ratio': 'total_record_ratio_rank',
+                'total_records': 'total_records_rank',
+                'leaderboard_points': 'leaderboard_points_rank',
             },
             request_field=request_field,
             auto=auto,
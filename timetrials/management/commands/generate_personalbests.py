@@ -0,0 +1,11 @@
+from timeit import timeit
+
+from django.core.management import BaseCommand
+
+from timetrials.models.scores import generate_all_personal_bests
+
+
+class Command(BaseCommand):
+
+    def handle(self, *args, **options):
+        print("Time taken:", timeit(generate_all_personal_bests, number=1))
@@ -2,13 +2,45 @@ from timeit import timeit
 
 from django.core.management import BaseCommand
 
+from timetrials.models.stats.player_stats import (
+    PlayerStatsGroup, calculate_player_stats, generate_all_player_stats,
+    generate_incremental_player_stats
+)
+from timetrials.models.stats.player_stats_vectorized import calculate_player_stats_vectorized
+
+
+ENGINES = {
+    'python': calculate_player_stats,
+    'numpy': calculate_player_stats_vectorized,
+}
+
 
 class Command(BaseCommand):
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help="Only recalculate players affected by submissions accepted since the last run.",
+        )
+        parser.add_argument(
+            '--engine',
+            choices=ENGINES.keys(),
+            default='python',
+            help="Stats engine to use. Both produce identical stats.",
+        )
+
     def handle(self, *args, **options):
-        print("Time taken:", timeit(
-            'generate_all_player_stats()',
-            setup='from timetrials.models.stats.player_stats import generate_all_player_stats',
-            number=1,
-            globals=globals()
-        ))
+        # Bulk create skips the post_save signal, which would also queue the generation task
+        group, = PlayerStatsGroup.objects.bulk_create([
+            PlayerStatsGroup(is_incremental=options['incremental'])
+        ])
+
+        if options['incremental']:
+            generate = generate_incremental_player_stats
+        else:
+            generate = generate_all_player_stats
+
+        calculate = ENGINES[options['engine']]
+
+        print("Time taken:", timeit(lambda: generate(group, calculate), number=1))
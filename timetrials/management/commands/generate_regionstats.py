@@ -2,13 +2,35 @@ from timeit import timeit
 
 from django.core.management import BaseCommand
 
+from timetrials.models.stats.region_stats import (
+    RegionStatsGroup, delete_old_region_stats_groups, generate_all_region_stats,
+    generate_all_region_stats_sql
+)
+
+
+ENGINES = {
+    'python': generate_all_region_stats,
+    'sql': generate_all_region_stats_sql,
+}
+
 
 class Command(BaseCommand):
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--engine',
+            choices=ENGINES.keys(),
+            default='sql',
+            help="Stats engine to use. The SQL engine runs entirely within the database, the "
+                 "Python engine loads every ranked score in memory.",
+        )
+
     def handle(self, *args, **options):
-        print("Time taken:", timeit(
-            'generate_all_region_stats()',
-            setup='from timetrials.models.stats.region_stats import generate_all_region_stats',
-            number=1,
-            globals=globals()
-        ))
+        # Bulk create skips the post_save signal, which would also queue the generation task
+        group, = RegionStatsGroup.objects.bulk_create([RegionStatsGroup()])
+
+        generate = ENGINES[options['engine']]
+
+        print("Time taken:", timeit(lambda: generate(group), number=1))
+
+        delete_old_region_stats_groups()
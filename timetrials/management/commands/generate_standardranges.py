@@ -0,0 +1,11 @@
+from timeit import timeit
+
+from django.core.management import BaseCommand
+
+from timetrials.models.standards import generate_standard_ranges
+
+
+class Command(BaseCommand):
+
+    def handle(self, *args, **options):
+        print("Time taken:", timeit(generate_standard_ranges, number=1))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetrials', '0020_playerstatsgroup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playerstatsgroup',
+            name='is_incremental',
+            field=models.BooleanField(default=False, help_text='Whether only players affected by submissions accepted since the previous group were recalculated'),
+        ),
+    ]
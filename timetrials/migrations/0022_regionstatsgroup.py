@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def assign_region_stats_group(apps, schema_editor):
+    RegionStats = apps.get_model('timetrials', 'RegionStats')
+    RegionStatsGroup = apps.get_model('timetrials', 'RegionStatsGroup')
+    db_alias = schema_editor.connection.alias
+    if RegionStats.objects.using(db_alias).exists():
+        group = RegionStatsGroup.objects.using(db_alias).create(completed=True)
+        RegionStats.objects.using(db_alias).all().update(group=group)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetrials', '0021_playerstatsgroup_is_incremental'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionStatsGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('completed', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='regionstats',
+            name='group',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='timetrials.regionstatsgroup'),
+        ),
+        migrations.RunPython(assign_region_stats_group, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='regionstats',
+            name='group',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='timetrials.regionstatsgroup'),
+        ),
+    ]
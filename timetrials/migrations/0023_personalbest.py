@@ -0,0 +1,58 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_personal_bests(apps, schema_editor):
+    PersonalBest = apps.get_model('timetrials', 'PersonalBest')
+    Score = apps.get_model('timetrials', 'Score')
+    db_alias = schema_editor.connection.alias
+    for category in (0, 1, 2):
+        scores = Score.objects.using(db_alias).filter(
+            category__lte=category,
+        ).order_by(
+            'player', 'track', 'is_lap', 'value', 'date', 'pk'
+        ).distinct(
+            'player', 'track', 'is_lap'
+        ).values_list('pk', 'player', 'track', 'is_lap', 'value')
+        PersonalBest.objects.using(db_alias).bulk_create([
+            PersonalBest(
+                player_id=player_id,
+                track_id=track_id,
+                is_lap=is_lap,
+                category=category,
+                score_id=score_id,
+                value=value,
+            )
+            for score_id, player_id, track_id, is_lap, value in scores
+        ], batch_size=10000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetrials', '0022_regionstatsgroup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonalBest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_lap', models.BooleanField(default=False, help_text='Off for 3lap, on for flap.')),
+                ('category', models.IntegerField(choices=[(0, 'Non-Shortcut'), (1, 'Shortcut'), (2, 'Unrestricted')], default=0, help_text='Scores of this category and more restricted categories are considered.')),
+                ('value', models.PositiveIntegerField(help_text='Finish time in milliseconds (e.g. 69999 for 1:09.999).')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='personal_bests', to='timetrials.player')),
+                ('score', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='personal_bests', to='timetrials.score')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='personal_bests', to='timetrials.track')),
+            ],
+            options={
+                'verbose_name': 'personal best',
+                'verbose_name_plural': 'personal bests',
+                'indexes': [models.Index(fields=['track', 'is_lap', 'category', 'value'], name='personal_best_ranking_idx')],
+                'constraints': [models.UniqueConstraint(fields=('player', 'track', 'is_lap', 'category'), name='unique_personal_best')],
+            },
+        ),
+        migrations.RunPython(populate_personal_bests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+RANK_PERSONAL_BESTS_SQL = """
+UPDATE timetrials_personalbest
+SET rank = ranked_personal_bests.rank
+FROM (
+    SELECT id, RANK() OVER (PARTITION BY track_id, is_lap, category ORDER BY value) AS rank
+    FROM timetrials_personalbest
+) AS ranked_personal_bests
+WHERE timetrials_personalbest.id = ranked_personal_bests.id
+"""
+
+INSERT_REGIONAL_RANKS_SQL = """
+WITH RECURSIVE region_ancestors (region_id, ancestor_id) AS (
+    SELECT id, id FROM timetrials_region
+    UNION ALL
+    SELECT region_ancestors.region_id, timetrials_region.parent_id
+    FROM region_ancestors
+    INNER JOIN timetrials_region ON timetrials_region.id = region_ancestors.ancestor_id
+    WHERE timetrials_region.parent_id IS NOT NULL
+)
+INSERT INTO timetrials_regionalrank
+    (personal_best_id, region_id, track_id, is_lap, category, value, rank)
+SELECT
+    personal_best.id,
+    ancestor.id,
+    personal_best.track_id,
+    personal_best.is_lap,
+    personal_best.category,
+    personal_best.value,
+    RANK() OVER (
+        PARTITION BY ancestor.id, personal_best.track_id, personal_best.is_lap,
+            personal_best.category
+        ORDER BY personal_best.value
+    )
+FROM timetrials_personalbest AS personal_best
+INNER JOIN timetrials_player AS player ON player.id = personal_best.player_id
+INNER JOIN region_ancestors ON region_ancestors.region_id = player.region_id
+INNER JOIN timetrials_region AS ancestor ON ancestor.id = region_ancestors.ancestor_id
+WHERE ancestor.is_ranked AND ancestor.type <> 'world'
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetrials', '0023_personalbest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionalRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_lap', models.BooleanField(default=False)),
+                ('category', models.IntegerField(choices=[(0, 'Non-Shortcut'), (1, 'Shortcut'), (2, 'Unrestricted')], default=0)),
+                ('value', models.PositiveIntegerField()),
+                ('rank', models.PositiveIntegerField(help_text='Rank among the personal bests of players from this ranked region.')),
+            ],
+            options={
+                'verbose_name': 'regional rank',
+                'verbose_name_plural': 'regional ranks',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='personalbest',
+            name='personal_best_ranking_idx',
+        ),
+        migrations.AddField(
+            model_name='personalbest',
+            name='rank',
+            field=models.PositiveIntegerField(default=0, help_text='Rank among the personal bests of every player.'),
+        ),
+        migrations.AddIndex(
+            model_name='personalbest',
+            index=models.Index(fields=['track', 'is_lap', 'category', 'rank'], name='personal_best_ranking_idx'),
+        ),
+        migrations.AddField(
+            model_name='regionalrank',
+            name='personal_best',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='regional_ranks', to='timetrials.personalbest'),
+        ),
+        migrations.AddField(
+            model_name='regionalrank',
+            name='region',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='regional_ranks', to='timetrials.region'),
+        ),
+        migrations.AddField(
+            model_name='regionalrank',
+            name='track',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='regional_ranks', to='timetrials.track'),
+        ),
+        migrations.AddIndex(
+            model_name='regionalrank',
+            index=models.Index(fields=['region', 'track', 'is_lap', 'category', 'rank'], name='regional_rank_ranking_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='regionalrank',
+            constraint=models.UniqueConstraint(fields=('personal_best', 'region'), name='unique_regional_rank'),
+        ),
+        migrations.RunSQL(RANK_PERSONAL_BESTS_SQL, migrations.RunSQL.noop),
+        migrations.RunSQL(INSERT_REGIONAL_RANKS_SQL, migrations.RunSQL.noop),
+    ]
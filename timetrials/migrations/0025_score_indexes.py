@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetrials', '0024_personalbest_rank'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='score',
+            index=models.Index(fields=['track', 'is_lap', 'value'], include=('category', 'player'), name='score_track_ranking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='score',
+            index=models.Index(fields=['player', 'track', 'is_lap', 'value'], include=('category', 'date'), name='score_player_ranking_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='score',
+            index=models.Index(fields=['initial_rank', '-date'], name='score_initial_rank_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='score',
+            index=models.Index(fields=['-date'], name='score_date_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+INSERT_REGION_CLOSURES_SQL = """
+WITH RECURSIVE region_closures (ancestor_id, descendant_id, depth) AS (
+    SELECT id, id, 0 FROM timetrials_region
+    UNION ALL
+    SELECT timetrials_region.parent_id, region_closures.descendant_id, region_closures.depth + 1
+    FROM region_closures
+    INNER JOIN timetrials_region ON timetrials_region.id = region_closures.ancestor_id
+    WHERE timetrials_region.parent_id IS NOT NULL
+)
+INSERT INTO timetrials_regionclosure (ancestor_id, descendant_id, depth)
+SELECT ancestor_id, descendant_id, depth FROM region_closures
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetrials', '0025_score_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(help_text='Number of levels between the ancestor and the descendant (0 for itself).')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_closures', to='timetrials.region')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_closures', to='timetrials.region')),
+            ],
+            options={
+                'verbose_name': 'region closure',
+                'verbose_name_plural': 'region closures',
+                'indexes': [models.Index(fields=['descendant', 'ancestor'], name='region_closure_ancestors_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_region_closure')],
+            },
+        ),
+        migrations.RunSQL(INSERT_REGION_CLOSURES_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:09
+
+from django.db import migrations, models
+
+
+RANK_REGION_STATS_SQL = """
+UPDATE timetrials_regionstats AS stats
+SET
+    average_rank = ranked_stats.average_rank,
+    average_standard = ranked_stats.average_standard,
+    average_record_ratio = ranked_stats.average_record_ratio,
+    rank = CASE WHEN ranked_stats.score_count > 0 THEN ranked_stats.rank END
+FROM (
+    SELECT
+        averages.*,
+        RANK() OVER (
+            PARTITION BY
+                averages.group_id,
+                averages.region_type,
+                averages.top_score_count,
+                averages.category,
+                averages.is_lap,
+                averages.score_count > 0
+            ORDER BY averages.average_rank
+        ) AS rank
+    FROM (
+        SELECT
+            counts.id,
+            counts.group_id,
+            counts.region_type,
+            counts.top_score_count,
+            counts.category,
+            counts.is_lap,
+            counts.score_count,
+            counts.total_rank::double precision / counts.effective_score_count AS average_rank,
+            counts.total_standard::double precision
+                / counts.effective_score_count AS average_standard,
+            counts.total_record_ratio / counts.effective_score_count AS average_record_ratio
+        FROM (
+            SELECT
+                region_stats.*,
+                region.type AS region_type,
+                NULLIF(CASE
+                    WHEN region_stats.top_score_count = 0 THEN region_stats.score_count
+                    ELSE (SELECT COUNT(*) FROM timetrials_track) * region_stats.top_score_count
+                        * (CASE WHEN region_stats.is_lap IS NULL THEN 2 ELSE 1 END)
+                END, 0) AS effective_score_count
+            FROM timetrials_regionstats AS region_stats
+            JOIN timetrials_region AS region ON region.id = region_stats.region_id
+        ) AS counts
+    ) AS averages
+) AS ranked_stats
+WHERE stats.id = ranked_stats.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetrials', '0026_regionclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='regionstats',
+            name='average_rank',
+            field=models.FloatField(help_text='Average rank of counted scores', null=True),
+        ),
+        migrations.AddField(
+            model_name='regionstats',
+            name='average_record_ratio',
+            field=models.FloatField(help_text='Average record ratio of counted scores', null=True),
+        ),
+        migrations.AddField(
+            model_name='regionstats',
+            name='average_standard',
+            field=models.FloatField(help_text='Average standard of counted scores', null=True),
+        ),
+        migrations.AddField(
+            model_name='regionstats',
+            name='rank',
+            field=models.IntegerField(help_text='Rank by average rank among regions of the same type, null without scores', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='regionstats',
+            index=models.Index(fields=['group', 'top_score_count', 'category', 'is_lap', 'rank'], name='region_stats_ranking_idx'),
+        ),
+        migrations.RunSQL(RANK_REGION_STATS_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:16
+
+from django.db import migrations, models
+
+
+RANK_PLAYER_STATS_SQL = """
+UPDATE timetrials_playerstats AS stats
+SET
+    total_score_rank = CASE WHEN ranked_stats.is_complete THEN ranked_stats.total_score_rank END,
+    total_rank_rank = CASE WHEN ranked_stats.is_complete THEN ranked_stats.total_rank_rank END,
+    total_standard_rank = CASE
+        WHEN ranked_stats.is_complete THEN ranked_stats.total_standard_rank
+    END,
+    total_record_ratio_rank = CASE
+        WHEN ranked_stats.is_complete THEN ranked_stats.total_record_ratio_rank
+    END,
+    total_records_rank = CASE
+        WHEN ranked_stats.is_complete THEN ranked_stats.total_records_rank
+    END,
+    leaderboard_points_rank = CASE
+        WHEN ranked_stats.is_complete THEN ranked_stats.leaderboard_points_rank
+    END
+FROM (
+    SELECT
+        id,
+        is_complete,
+        RANK() OVER (ranking ORDER BY total_score) AS total_score_rank,
+        RANK() OVER (ranking ORDER BY total_rank) AS total_rank_rank,
+        RANK() OVER (ranking ORDER BY total_standard) AS total_standard_rank,
+        RANK() OVER (ranking ORDER BY total_record_ratio DESC) AS total_record_ratio_rank,
+        RANK() OVER (ranking ORDER BY total_records) AS total_records_rank,
+        RANK() OVER (ranking ORDER BY leaderboard_points DESC) AS leaderboard_points_rank
+    FROM (
+        SELECT
+            *,
+            score_count = (SELECT COUNT(*) FROM timetrials_track)
+                * (CASE WHEN is_lap IS NULL THEN 2 ELSE 1 END) AS is_complete
+        FROM timetrials_playerstats
+    ) AS player_stats
+    WINDOW ranking AS (PARTITION BY group_id, region_id, category, is_lap, is_complete)
+) AS ranked_stats
+WHERE stats.id = ranked_stats.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetrials', '0027_regionstats_ranking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playerstats',
+            name='leaderboard_points_rank',
+            field=models.IntegerField(help_text='Rank by leaderboard points', null=True),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='total_rank_rank',
+            field=models.IntegerField(help_text='Rank by total rank', null=True),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='total_record_ratio_rank',
+            field=models.IntegerField(help_text='Rank by total record ratio', null=True),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='total_records_rank',
+            field=models.IntegerField(help_text='Rank by total records', null=True),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='total_score_rank',
+            field=models.IntegerField(help_text='Rank by total score', null=True),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='total_standard_rank',
+            field=models.IntegerField(help_text='Rank by total standard', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='playerstats',
+            index=models.Index(fields=['group', 'region', 'category', 'is_lap', 'total_score_rank'], name='player_stats_score_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerstats',
+            index=models.Index(fields=['group', 'region', 'category', 'is_lap', 'total_rank_rank'], name='player_stats_rank_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerstats',
+            index=models.Index(fields=['group', 'region', 'category', 'is_lap', 'total_standard_rank'], name='player_stats_standard_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerstats',
+            index=models.Index(fields=['group', 'region', 'category', 'is_lap', 'total_record_ratio_rank'], name='player_stats_ratio_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerstats',
+            index=models.Index(fields=['group', 'region', 'category', 'is_lap', 'total_records_rank'], name='player_stats_records_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerstats',
+            index=models.Index(fields=['group', 'region', 'category', 'is_lap', 'leaderboard_points_rank'], name='player_stats_points_rank_idx'),
+        ),
+        migrations.RunSQL(RANK_PLAYER_STATS_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:19
+
+from django.db import migrations, models
+
+
+ACTIVATE_LATEST_GROUP_SQL = """
+UPDATE timetrials_playerstatsgroup
+SET is_active = TRUE
+WHERE id = (
+    SELECT id FROM timetrials_playerstatsgroup
+    WHERE completed
+    ORDER BY created_at DESC
+    LIMIT 1
+)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetrials', '0028_playerstats_metric_ranks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playerstatsgroup',
+            name='is_active',
+            field=models.BooleanField(default=False, help_text='Whether this group holds the stats currently shown to users'),
+        ),
+        migrations.AddConstraint(
+            model_name='playerstatsgroup',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='unique_active_player_stats_group'),
+        ),
+        migrations.RunSQL(ACTIVATE_LATEST_GROUP_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:32
+
+from collections import defaultdict
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.backends.postgresql.psycopg_any import NumericRange
+
+
+def find_standard_level(standards, value):
+    qualifying = [
+        standard for standard in standards
+        if standard['value'] is None or (value is not None and standard['value'] >= value)
+    ]
+    if not qualifying:
+        return None
+    return min(qualifying, key=lambda standard: (
+        -standard['category'], standard['value'] is None, standard['value'] or 0
+    ))['level']
+
+
+def populate_standard_ranges(apps, schema_editor):
+    Standard = apps.get_model('timetrials', 'Standard')
+    StandardRange = apps.get_model('timetrials', 'StandardRange')
+    db_alias = schema_editor.connection.alias
+
+    standards = defaultdict(list)
+    for standard in Standard.objects.using(db_alias).values(
+        'track', 'is_lap', 'category', 'level', 'level__is_legacy', 'value'
+    ):
+        key = (standard['track'], standard['is_lap'], standard['level__is_legacy'])
+        standards[key].append(standard)
+
+    standard_ranges = list()
+    for (track_id, is_lap, is_legacy), track_standards in standards.items():
+        for category in (0, 1, 2):
+            category_standards = [
+                standard for standard in track_standards if standard['category'] <= category
+            ]
+            thresholds = sorted({standard['value'] for standard in category_standards} - {None})
+
+            ranges = list()
+            lower = None
+            for upper in thresholds + [None]:
+                level = find_standard_level(category_standards, upper)
+                if ranges and ranges[-1][0] == level and ranges[-1][2] == lower:
+                    ranges[-1] = (level, ranges[-1][1], upper)
+                elif level is not None:
+                    ranges.append((level, lower, upper))
+                lower = upper
+
+            standard_ranges.extend(
+                StandardRange(
+                    track_id=track_id,
+                    is_lap=is_lap,
+                    category=category,
+                    is_legacy=is_legacy,
+                    level_id=level_id,
+                    values=NumericRange(lower, upper, '(]'),
+                )
+                for level_id, lower, upper in ranges
+            )
+
+    StandardRange.objects.using(db_alias).bulk_create(standard_ranges)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetrials', '0029_playerstatsgroup_is_active'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StandardRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_lap', models.BooleanField(default=False, help_text='Off for 3lap, on for flap.')),
+                ('category', models.IntegerField(choices=[(0, 'Non-Shortcut'), (1, 'Shortcut'), (2, 'Unrestricted')], default=0, help_text='Category of the leaderboard, whose standards include those of more restricted categories')),
+                ('is_legacy', models.BooleanField(help_text='Whether the standard level is a legacy one.')),
+                ('values', django.contrib.postgres.fields.ranges.IntegerRangeField(help_text='Scores qualifying for the standard level')),
+                ('level', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ranges', to='timetrials.standardlevel')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standard_ranges', to='timetrials.track')),
+            ],
+            options={
+                'verbose_name': 'standard range',
+                'verbose_name_plural': 'standard ranges',
+                'indexes': [models.Index(fields=['track', 'is_lap', 'category', 'is_legacy'], name='standard_range_lookup_idx'), django.contrib.postgres.indexes.GistIndex(fields=['values'], name='standard_range_values_idx')],
+            },
+        ),
+        migrations.RunPython(populate_standard_ranges, migrations.RunPython.noop),
+    ]
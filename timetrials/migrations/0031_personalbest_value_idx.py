@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-17 00:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetrials', '0030_standardrange'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='personalbest',
+            index=models.Index(fields=['track', 'is_lap', 'category', 'value'], name='personal_best_value_idx'),
+        ),
+    ]
@@ -1,10 +1,11 @@
 from timetrials.models.categories import CategoryChoices
 from timetrials.models.players import Player, PlayerAward, PlayerSubmitter
-from timetrials.models.regions import Region, RegionTypeChoices
+from timetrials.models.regions import Region, RegionClosure, RegionTypeChoices
 from timetrials.models.scores import (
-  EditScoreSubmission, Score, ScoreSubmission, ScoreSubmissionStatus
+  EditScoreSubmission, PersonalBest, RegionalRank, Score, ScoreSubmission,
+  ScoreSubmissionStatus
 )
 from timetrials.models.sitechamp import SiteChampion
-from timetrials.models.standards import Standard, StandardLevel
-from timetrials.models.stats import PlayerStats, PlayerStatsGroup, RegionStats
+from timetrials.models.standards import Standard, StandardLevel, StandardRange
+from timetrials.models.stats import PlayerStats, PlayerStatsGroup, RegionStats, RegionStatsGroup
 from timetrials.models.tracks import Track, TrackCup
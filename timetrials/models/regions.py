@@ -1,8 +1,11 @@
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 
 from tree_queries.models import TreeNode
 
+from timetrials.versioned_cache import VersionedCache
+
 
 class RegionTypeChoices(models.TextChoices):
     WORLD = 'world', _("World")
@@ -44,3 +47,133 @@ class Region(TreeNode):
     class Meta:
         verbose_name = _("region")
         verbose_name_plural = _("regions")
+
+
+class RegionClosure(models.Model):
+    ancestor = models.ForeignKey(
+        Region,
+        related_name='descendant_closures',
+        on_delete=models.CASCADE,
+    )
+
+    descendant = models.ForeignKey(
+        Region,
+        related_name='ancestor_closures',
+        on_delete=models.CASCADE,
+    )
+
+    depth = models.PositiveIntegerField(
+        help_text=_("Number of levels between the ancestor and the descendant (0 for itself).")
+    )
+
+    def __str__(self):
+        return f"{self.ancestor} > {self.descendant}"
+
+    class Meta:
+        verbose_name = _("region closure")
+        verbose_name_plural = _("region closures")
+
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'],
+                                    name='unique_region_closure'),
+        ]
+
+        indexes = [
+            models.Index(fields=['descendant', 'ancestor'], name='region_closure_ancestors_idx'),
+        ]
+
+
+def generate_region_closures():
+    """Recalculate every ancestor and descendant pair of the region tree"""
+
+    closures = [
+        RegionClosure(ancestor_id=ancestor_id, descendant_id=region.pk, depth=depth)
+        for region in Region.objects.with_tree_fields()
+        for depth, ancestor_id in enumerate(reversed(region.tree_path))
+    ]
+
+    with transaction.atomic():
+        RegionClosure.objects.all().delete()
+        RegionClosure.objects.bulk_create(closures)
+
+
+def query_region_ancestor_ids(region_id: int) -> set[int]:
+    """Query the ids of a region and all of its ancestors."""
+
+    return set(RegionClosure.objects.filter(
+        descendant=region_id
+    ).values_list('ancestor', flat=True))
+
+
+def query_region_descendants() -> dict[int, frozenset[int]]:
+    """Map each region's id to the ids of the region and all of its descendants."""
+
+    descendants = dict()
+
+    for ancestor_id, region_id in RegionClosure.objects.values_list('ancestor', 'descendant'):
+        descendants.setdefault(ancestor_id, set()).add(region_id)
+
+    return {region_id: frozenset(region_ids) for region_id, region_ids in descendants.items()}
+
+
+region_descendants_cache = VersionedCache('region_descendants', query_region_descendants)
+
+
+def get_region_descendants() -> dict[int, frozenset[int]]:
+    """
+    Get the ids of every region's descendants from the in-process cache, which is shared with
+    other processes through the cache backend.
+    """
+
+    return region_descendants_cache.get()
+
+
+def get_region_descendant_ids(region: Region) -> frozenset[int]:
+    """Get the ids of a region and all of its descendants."""
+
+    descendant_ids = get_region_descendants().get(region.pk)
+
+    if descendant_ids is None:
+        # The region was created after the cache was last refreshed
+        return frozenset(region.descendants(include_self=True).values_list('pk', flat=True))
+
+    return descendant_ids
+
+
+def invalidate_region_descendants():
+    """Invalidate the cached region descendants once the current transaction is committed."""
+
+    region_descendants_cache.invalidate()
+
+
+REGION_PLAYER_COUNTS_KEY = 'region_player_counts'
+
+
+def query_region_player_counts() -> dict[int, int]:
+    """Count the players of every region, including players from its descendants."""
+
+    return dict(RegionClosure.objects.values(
+        'ancestor'
+    ).annotate(
+        player_count=models.Count('descendant__players')
+    ).values_list(
+        'ancestor', 'player_count'
+    ))
+
+
+def get_region_player_counts() -> dict[int, int]:
+    """Get the player count of every region from the cache, counting them if not cached."""
+
+    player_counts = cache.get(REGION_PLAYER_COUNTS_KEY)
+
+    if player_counts is None:
+        player_counts = query_region_player_counts()
+        cache.set(REGION_PLAYER_COUNTS_KEY, player_counts, timeout=None)
+
+    return player_counts
+
+
+def invalidate_region_player_counts():
+    """Invalidate the cached region player counts once the current transaction is committed."""
+
+    transaction.on_commit(lambda: cache.delete(REGION_PLAYER_COUNTS_KEY))
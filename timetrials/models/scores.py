@@ -1,5 +1,7 @@
+from itertools import groupby
+
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -7,6 +9,7 @@ from django_cte import CTEManager
 
 from timetrials.models.categories import CategoryChoices
 from timetrials.models.players import Player
+from timetrials.models.regions import Region, RegionTypeChoices
 from timetrials.models.tracks import Track
 
 
@@ -57,13 +60,30 @@ class AbstractScore(models.Model):
 
     @property
     def overall_rank(self) -> int:
-        """Calculate the overall rank of this score."""
-        return Score.objects.filter(
-            track=self.track,
+        """
+        Calculate the overall rank of this score among the personal bests of every player. It is
+        the rank of the fastest personal best which is not faster, found with the value index.
+        """
+
+        personal_bests = PersonalBest.objects.filter(
+            track=self.track_id,
             is_lap=self.is_lap,
-            category__lte=self.category,
-            value__lt=self.value,
-        ).order_by('player', 'value').distinct('player').count() + 1
+            category=self.category,
+        )
+
+        rank = personal_bests.filter(
+            value__gte=self.value
+        ).order_by('value').values_list('rank', flat=True).first()
+        if rank is not None:
+            return rank
+
+        # Slower than every personal best, ranked right after the slowest ones
+        slowest = personal_bests.order_by('-value').values_list('value', 'rank').first()
+        if slowest is None:
+            return 1
+
+        value, rank = slowest
+        return rank + personal_bests.filter(value=value).count()
 
     class Meta:
         abstract = True
@@ -81,6 +101,434 @@ class Score(AbstractScore):
         verbose_name = _("score")
         verbose_name_plural = _("scores")
 
+        indexes = [
+            models.Index(fields=['track', 'is_lap', 'value'], include=['category', 'player'],
+                         name='score_track_ranking_idx'),
+            models.Index(fields=['player', 'track', 'is_lap', 'value'],
+                         include=['category', 'date'], name='score_player_ranking_idx'),
+            models.Index(fields=['initial_rank', '-date'], name='score_initial_rank_date_idx'),
+            models.Index(fields=['-date'], name='score_date_idx'),
+        ]
+
+
+class PersonalBest(models.Model):
+    player = models.ForeignKey(Player, related_name='personal_bests', on_delete=models.CASCADE)
+    track = models.ForeignKey(Track, related_name='personal_bests', on_delete=models.CASCADE)
+
+    is_lap = models.BooleanField(default=False, help_text=_("Off for 3lap, on for flap."))
+
+    category = models.IntegerField(
+        choices=CategoryChoices.choices,
+        default=CategoryChoices.NON_SHORTCUT,
+        help_text=_("Scores of this category and more restricted categories are considered."),
+    )
+
+    score = models.ForeignKey(Score, related_name='personal_bests', on_delete=models.CASCADE)
+
+    value = models.PositiveIntegerField(
+        help_text=_("Finish time in milliseconds (e.g. 69999 for 1:09.999).")
+    )
+
+    rank = models.PositiveIntegerField(
+        default=0,
+        help_text=_("Rank among the personal bests of every player.")
+    )
+
+    def __str__(self):
+        return value_to_string(self.value)
+
+    class Meta:
+        verbose_name = _("personal best")
+        verbose_name_plural = _("personal bests")
+
+        constraints = [
+            models.UniqueConstraint(fields=['player', 'track', 'is_lap', 'category'],
+                                    name='unique_personal_best'),
+        ]
+
+        indexes = [
+            models.Index(fields=['track', 'is_lap', 'category', 'rank'],
+                         name='personal_best_ranking_idx'),
+            models.Index(fields=['track', 'is_lap', 'category', 'value'],
+                         name='personal_best_value_idx'),
+        ]
+
+
+class RegionalRank(models.Model):
+    personal_best = models.ForeignKey(
+        PersonalBest,
+        related_name='regional_ranks',
+        on_delete=models.CASCADE,
+    )
+
+    region = models.ForeignKey(Region, related_name='regional_ranks', on_delete=models.CASCADE)
+    track = models.ForeignKey(Track, related_name='regional_ranks', on_delete=models.CASCADE)
+
+    is_lap = models.BooleanField(default=False)
+
+    category = models.IntegerField(
+        choices=CategoryChoices.choices,
+        default=CategoryChoices.NON_SHORTCUT,
+    )
+
+    value = models.PositiveIntegerField()
+
+    rank = models.PositiveIntegerField(
+        help_text=_("Rank among the personal bests of players from this ranked region.")
+    )
+
+    def __str__(self):
+        return f"{self.region} #{self.rank}"
+
+    class Meta:
+        verbose_name = _("regional rank")
+        verbose_name_plural = _("regional ranks")
+
+        constraints = [
+            models.UniqueConstraint(fields=['personal_best', 'region'],
+                                    name='unique_regional_rank'),
+        ]
+
+        indexes = [
+            models.Index(fields=['region', 'track', 'is_lap', 'category', 'rank'],
+                         name='regional_rank_ranking_idx'),
+        ]
+
+
+def query_ranked_region_ids(player_id: int) -> list[int]:
+    """Query the ranked regions a player is part of, excluding the world region."""
+
+    return list(Region.objects.filter(
+        descendant_closures__descendant__players=player_id,
+        is_ranked=True,
+    ).exclude(
+        type=RegionTypeChoices.WORLD
+    ).values_list('pk', flat=True))
+
+
+def lock_leaderboards(track_ids):
+    """
+    Lock the leaderboards of the given tracks until the end of the current transaction, so that
+    personal bests and ranks of the same track are only updated by one transaction at a time.
+    Tracks are locked in a consistent order to avoid deadlocks.
+    """
+
+    list(Track.objects.select_for_update().filter(
+        pk__in=track_ids
+    ).order_by('pk').values_list('pk', flat=True))
+
+
+def shift_ranks(ranks: models.QuerySet, old_value: int | None, new_value: int | None):
+    """
+    Update the ranks of a single leaderboard for a personal best moving from an old value to a new
+    value, where either value is None when the personal best is added or removed.
+    """
+
+    if old_value is None:
+        ranks.filter(value__gt=new_value).update(rank=models.F('rank') + 1)
+    elif new_value is None:
+        ranks.filter(value__gt=old_value).update(rank=models.F('rank') - 1)
+    elif new_value < old_value:
+        ranks.filter(value__gt=new_value, value__lte=old_value).update(rank=models.F('rank') + 1)
+    elif new_value > old_value:
+        ranks.filter(value__gt=old_value, value__lte=new_value).update(rank=models.F('rank') - 1)
+
+
+def insert_regional_ranks(personal_best: PersonalBest, region_ids, shift=True):
+    """Rank a personal best within each of the given regions."""
+
+    regional_ranks = list()
+
+    for region_id in region_ids:
+        ranks = RegionalRank.objects.filter(
+            region=region_id,
+            track=personal_best.track_id,
+            is_lap=personal_best.is_lap,
+            category=personal_best.category,
+        )
+        if shift:
+            shift_ranks(ranks, None, personal_best.value)
+
+        regional_ranks.append(RegionalRank(
+            personal_best=personal_best,
+            region_id=region_id,
+            track_id=personal_best.track_id,
+            is_lap=personal_best.is_lap,
+            category=personal_best.category,
+            value=personal_best.value,
+            rank=ranks.filter(value__lt=personal_best.value).count() + 1,
+        ))
+
+    RegionalRank.objects.bulk_create(regional_ranks)
+
+
+def assign_ranks(ranked_objects: list, key):
+    """Assign the rank of each object by value among the objects sharing the same key."""
+
+    ranked_objects.sort(key=lambda obj: (key(obj), obj.value))
+
+    for _group_key, objects in groupby(ranked_objects, key=key):
+        previous = None
+        for position, obj in enumerate(objects, start=1):
+            if previous is not None and previous.value == obj.value:
+                obj.rank = previous.rank
+            else:
+                obj.rank = position
+            previous = obj
+
+
+def delete_personal_bests(personal_bests: models.QuerySet):
+    """Delete personal bests, moving up the ranks of slower ones."""
+
+    with transaction.atomic():
+        lock_leaderboards(personal_bests.values('track'))
+
+        for personal_best in personal_bests.prefetch_related('regional_ranks'):
+            for regional_rank in personal_best.regional_ranks.all():
+                shift_ranks(
+                    RegionalRank.objects.filter(
+                        region=regional_rank.region_id,
+                        track=regional_rank.track_id,
+                        is_lap=regional_rank.is_lap,
+                        category=regional_rank.category,
+                    ),
+                    regional_rank.value,
+                    None
+                )
+
+            shift_ranks(
+                PersonalBest.objects.filter(
+                    track=personal_best.track_id,
+                    is_lap=personal_best.is_lap,
+                    category=personal_best.category,
+                ),
+                personal_best.value,
+                None
+            )
+
+            personal_best.delete()
+
+
+def find_personal_bests(scores) -> list[PersonalBest]:
+    """
+    Find the best score for every category given scores of a single player, track and lap mode
+    ordered from best to worst.
+    """
+
+    personal_bests = list()
+
+    for category in CategoryChoices.values:
+        for score in scores:
+            if score.category <= category:
+                personal_bests.append(PersonalBest(
+                    player_id=score.player_id,
+                    track_id=score.track_id,
+                    is_lap=score.is_lap,
+                    category=category,
+                    score_id=score.pk,
+                    value=score.value,
+                ))
+                break
+
+    return personal_bests
+
+
+def update_personal_bests(player_id: int, track_id: int, is_lap: bool):
+    """
+    Recalculate the personal bests of a player on a track for every category, only shifting the
+    ranks of personal bests between the previous and the new value.
+    """
+
+    with transaction.atomic():
+        # Personal bests are read once the leaderboard is locked so that ranks are shifted from
+        # up-to-date values
+        lock_leaderboards([track_id])
+
+        scores = Score.objects.filter(
+            player=player_id,
+            track=track_id,
+            is_lap=is_lap,
+        ).order_by(
+            'value', 'date', 'pk'
+        ).only(
+            'player', 'track', 'is_lap', 'category', 'value'
+        )
+
+        new_personal_bests = {pb.category: pb for pb in find_personal_bests(scores)}
+        old_personal_bests = {
+            pb.category: pb
+            for pb in PersonalBest.objects.filter(player=player_id, track=track_id, is_lap=is_lap)
+        }
+
+        region_ids = query_ranked_region_ids(player_id)
+
+        for category in CategoryChoices.values:
+            old_pb = old_personal_bests.get(category)
+            new_pb = new_personal_bests.get(category)
+
+            old_value = old_pb.value if old_pb else None
+            new_value = new_pb.value if new_pb else None
+
+            if old_pb is None and new_pb is None:
+                continue
+
+            if old_pb and new_pb and old_pb.score_id == new_pb.score_id and old_value == new_value:
+                continue
+
+            if old_pb:
+                old_pb.delete()
+
+            ranks = PersonalBest.objects.filter(track=track_id, is_lap=is_lap, category=category)
+            shift_ranks(ranks, old_value, new_value)
+
+            for region_id in region_ids:
+                shift_ranks(
+                    RegionalRank.objects.filter(
+                        region=region_id, track=track_id, is_lap=is_lap, category=category
+                    ),
+                    old_value,
+                    new_value
+                )
+
+            if new_pb:
+                new_pb.rank = ranks.filter(value__lt=new_value).count() + 1
+                new_pb.save()
+                insert_regional_ranks(new_pb, region_ids, shift=False)
+
+
+def update_player_regional_ranks(player_id: int):
+    """Move the regional ranks of a player's personal bests to the ranked regions they are from."""
+
+    with transaction.atomic():
+        lock_leaderboards(PersonalBest.objects.filter(player=player_id).values('track'))
+
+        region_ids = set(query_ranked_region_ids(player_id))
+        ranked_region_ids = set(RegionalRank.objects.filter(
+            personal_best__player=player_id
+        ).values_list('region', flat=True).distinct())
+
+        if region_ids == ranked_region_ids:
+            return
+
+        for regional_rank in RegionalRank.objects.filter(
+            personal_best__player=player_id,
+            region__in=ranked_region_ids - region_ids,
+        ):
+            regional_rank.delete()
+            shift_ranks(
+                RegionalRank.objects.filter(
+                    region=regional_rank.region_id,
+                    track=regional_rank.track_id,
+                    is_lap=regional_rank.is_lap,
+                    category=regional_rank.category,
+                ),
+                regional_rank.value,
+                None
+            )
+
+        for personal_best in PersonalBest.objects.filter(player=player_id):
+            insert_regional_ranks(personal_best, region_ids - ranked_region_ids)
+
+
+def generate_all_personal_bests():
+    """Recalculate the personal bests of all players along with their ranks"""
+
+    with transaction.atomic():
+        # Scores are read once every leaderboard is locked so that no concurrent update is lost
+        lock_leaderboards(Track.objects.values('pk'))
+
+        scores = Score.objects.order_by(
+            'player', 'track', 'is_lap', 'value', 'date', 'pk'
+        ).only(
+            'player', 'track', 'is_lap', 'category', 'value'
+        )
+
+        personal_bests = list()
+        current_key = None
+        current_scores = list()
+
+        for score in scores.iterator(chunk_size=10000):
+            key = (score.player_id, score.track_id, score.is_lap)
+            if key != current_key:
+                personal_bests.extend(find_personal_bests(current_scores))
+                current_key = key
+                current_scores = list()
+            current_scores.append(score)
+
+        personal_bests.extend(find_personal_bests(current_scores))
+
+        assign_ranks(personal_bests, key=lambda pb: (pb.track_id, pb.is_lap, pb.category))
+
+        player_regions = {
+            player_id: query_ranked_region_ids(player_id)
+            for player_id in Player.objects.filter(
+                region__isnull=False
+            ).values_list('pk', flat=True)
+        }
+
+        PersonalBest.objects.all().delete()
+        PersonalBest.objects.bulk_create(personal_bests, batch_size=10000)
+
+        regional_ranks = [
+            RegionalRank(
+                personal_best=personal_best,
+                region_id=region_id,
+                track_id=personal_best.track_id,
+                is_lap=personal_best.is_lap,
+                category=personal_best.category,
+                value=personal_best.value,
+            )
+            for personal_best in personal_bests
+            for region_id in player_regions.get(personal_best.player_id, ())
+        ]
+        assign_ranks(
+            regional_ranks,
+            key=lambda rank: (rank.region_id, rank.track_id, rank.is_lap, rank.category)
+        )
+        RegionalRank.objects.bulk_create(regional_ranks, batch_size=10000)
+
+
+def generate_regional_ranks(region_ids):
+    """
+    Recalculate the regional ranks of the given regions from the personal bests of their players,
+    removing those of regions which are no longer ranked.
+    """
+
+    with transaction.atomic():
+        lock_leaderboards(Track.objects.values('pk'))
+
+        RegionalRank.objects.filter(region__in=region_ids).delete()
+
+        ranked_region_ids = Region.objects.filter(
+            pk__in=region_ids,
+            is_ranked=True,
+        ).exclude(
+            type=RegionTypeChoices.WORLD
+        ).values('pk')
+
+        regional_ranks = [
+            RegionalRank(
+                personal_best=personal_best,
+                region_id=personal_best.ranked_region_id,
+                track_id=personal_best.track_id,
+                is_lap=personal_best.is_lap,
+                category=personal_best.category,
+                value=personal_best.value,
+            )
+            for personal_best in PersonalBest.objects.filter(
+                player__region__ancestor_closures__ancestor__in=ranked_region_ids,
+            ).annotate(
+                ranked_region_id=models.F('player__region__ancestor_closures__ancestor'),
+            ).only(
+                'track', 'is_lap', 'category', 'value'
+            )
+        ]
+        assign_ranks(
+            regional_ranks,
+            key=lambda rank: (rank.region_id, rank.track_id, rank.is_lap, rank.category)
+        )
+        RegionalRank.objects.bulk_create(regional_ranks, batch_size=10000)
+
 
 class AbstractSubmission(models.Model):
     status = models.IntegerField(
@@ -121,6 +569,8 @@ class AbstractSubmission(models.Model):
 
 
 class ScoreSubmission(AbstractScore, AbstractSubmission):
+    objects = CTEManager()
+
     score = models.OneToOneField(
         Score,
         related_name='submission',
@@ -1,4 +1,12 @@
-from django.db import models
+import threading
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.contrib.postgres.fields import IntegerRangeField
+from django.contrib.postgres.indexes import GistIndex
+from django.db import models, transaction
+from django.db.backends.postgresql.psycopg_any import NumericRange
 from django.utils.translation import gettext_lazy as _
 
 from timetrials.models.categories import CategoryChoices
@@ -65,3 +73,171 @@ class Standard(models.Model):
             models.UniqueConstraint('level', 'track', 'category', 'is_lap',
                                     name='unique_by_level_track_category_lap'),
         ]
+
+
+class StandardRange(models.Model):
+    """
+    Range of scores qualifying for a standard level, derived from standards. Ranges of the same
+    track, lap mode, category and legacy flag never overlap.
+    """
+
+    track = models.ForeignKey(
+        Track,
+        related_name='standard_ranges',
+        on_delete=models.CASCADE,
+    )
+
+    is_lap = models.BooleanField(default=False, help_text=_("Off for 3lap, on for flap."))
+
+    category = models.IntegerField(
+        choices=CategoryChoices.choices,
+        default=CategoryChoices.NON_SHORTCUT,
+        help_text=_("Category of the leaderboard, whose standards include those of more "
+                    "restricted categories"),
+    )
+
+    is_legacy = models.BooleanField(help_text=_("Whether the standard level is a legacy one."))
+
+    level = models.ForeignKey(
+        StandardLevel,
+        related_name='ranges',
+        on_delete=models.CASCADE,
+    )
+
+    values = IntegerRangeField(help_text=_("Scores qualifying for the standard level"))
+
+    def __str__(self):
+        return f"{self.level} {self.values}"
+
+    class Meta:
+        verbose_name = _("standard range")
+        verbose_name_plural = _("standard ranges")
+
+        indexes = [
+            models.Index(
+                fields=['track', 'is_lap', 'category', 'is_legacy'],
+                name='standard_range_lookup_idx',
+            ),
+            GistIndex(fields=['values'], name='standard_range_values_idx'),
+        ]
+
+
+def find_standard_level(standards: list[dict], value: int | None) -> int | None:
+    """
+    Find the level of the standard a score qualifies for among the given standards, the same way
+    as `annotate_scores_standard` used to. A value of None stands for a score slower than every
+    threshold.
+    """
+
+    qualifying = [
+        standard for standard in standards
+        if standard['value'] is None or (value is not None and standard['value'] >= value)
+    ]
+
+    if not qualifying:
+        return None
+
+    # Standards of the least restricted category first, then the lowest threshold, catch-all last
+    return min(qualifying, key=lambda standard: (
+        -standard['category'], standard['value'] is None, standard['value'] or 0
+    ))['level']
+
+
+def find_standard_ranges(standards: list[dict]) -> list[tuple[int, int | None, int | None]]:
+    """
+    Split scores into ranges of scores qualifying for the same standard level. Returns tuples of
+    level, exclusive lower bound and inclusive upper bound, where None is unbounded.
+    """
+
+    thresholds = sorted({standard['value'] for standard in standards} - {None})
+
+    ranges = list()
+    lower = None
+
+    for upper in thresholds + [None]:
+        level = find_standard_level(standards, upper)
+
+        if ranges and ranges[-1][0] == level and ranges[-1][2] == lower:
+            ranges[-1] = (level, ranges[-1][1], upper)
+        elif level is not None:
+            ranges.append((level, lower, upper))
+
+        lower = upper
+
+    return ranges
+
+
+def generate_standard_ranges(keys=None):
+    """
+    Rebuild the standard ranges from the standards, either all of them or only those of the given
+    track, lap mode and legacy flag tuples.
+    """
+
+    standards_queryset = Standard.objects.all()
+    ranges_queryset = StandardRange.objects.all()
+
+    if keys is not None:
+        if not keys:
+            return
+
+        standards_queryset = standards_queryset.filter(reduce(or_, (
+            models.Q(track=track_id, is_lap=is_lap, level__is_legacy=is_legacy)
+            for track_id, is_lap, is_legacy in keys
+        )))
+        ranges_queryset = ranges_queryset.filter(reduce(or_, (
+            models.Q(track=track_id, is_lap=is_lap, is_legacy=is_legacy)
+            for track_id, is_lap, is_legacy in keys
+        )))
+
+    standards = defaultdict(list)
+    for standard in standards_queryset.values(
+        'track', 'is_lap', 'category', 'level', 'level__is_legacy', 'value'
+    ):
+        key = (standard['track'], standard['is_lap'], standard['level__is_legacy'])
+        standards[key].append(standard)
+
+    standard_ranges = list()
+
+    for (track_id, is_lap, is_legacy), track_standards in standards.items():
+        for category in CategoryChoices.values:
+            standard_ranges.extend(
+                StandardRange(
+                    track_id=track_id,
+                    is_lap=is_lap,
+                    category=category,
+                    is_legacy=is_legacy,
+                    level_id=level_id,
+                    values=NumericRange(lower, upper, '(]'),
+                )
+                for level_id, lower, upper in find_standard_ranges([
+                    standard for standard in track_standards if standard['category'] <= category
+                ])
+            )
+
+    with transaction.atomic():
+        ranges_queryset.delete()
+        StandardRange.objects.bulk_create(standard_ranges)
+
+
+# Keys of standard ranges waiting to be rebuilt once the current transaction is committed
+pending_standard_ranges = threading.local()
+
+
+def queue_standard_ranges(keys):
+    """
+    Rebuild the standard ranges of the given track, lap mode and legacy flag tuples once the
+    current transaction is committed. Keys queued within the same transaction are rebuilt at once.
+    """
+
+    if getattr(pending_standard_ranges, 'keys', None) is None:
+        pending_standard_ranges.keys = set()
+    pending_standard_ranges.keys.update(keys)
+
+    def rebuild():
+        # The first callback of the transaction rebuilds every key, the following ones do nothing
+        keys = pending_standard_ranges.keys
+        pending_standard_ranges.keys = None
+        if keys:
+            generate_standard_ranges(keys)
+
+    transaction.on_commit(rebuild)
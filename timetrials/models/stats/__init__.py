@@ -1,2 +1,2 @@
 from timetrials.models.stats.player_stats import PlayerStats, PlayerStatsGroup
-from timetrials.models.stats.region_stats import RegionStats
+from timetrials.models.stats.region_stats import RegionStats, RegionStatsGroup
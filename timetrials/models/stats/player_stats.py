@@ -2,25 +2,96 @@ from bisect import insort
 from collections import defaultdict
 from functools import reduce
 
-from django.db import models
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import Min, Q
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from timetrials.models.categories import CategoryChoices
 from timetrials.models.players import Player
-from timetrials.models.regions import Region
+from timetrials.models.regions import Region, RegionTypeChoices
+from timetrials.models.scores import Score, ScoreSubmission, ScoreSubmissionStatus
 from timetrials.models.standards import Standard
-from timetrials.models.tracks import Track
-from timetrials.queries import query_ranked_scores
+from timetrials.models.tracks import get_track_count, get_track_ids
+from timetrials.queries import (
+    query_precomputed_ranked_scores, query_ranked_scores, query_region_players
+)
 
 
 class PlayerStatsGroup(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     completed = models.BooleanField(default=False)
+    is_incremental = models.BooleanField(
+        default=False,
+        help_text=_("Whether only players affected by submissions accepted since the previous "
+                    "group were recalculated"),
+    )
+    is_active = models.BooleanField(
+        default=False,
+        help_text=_("Whether this group holds the stats currently shown to users"),
+    )
 
     def __str__(self):
         return str(timezone.datetime.strftime(self.created_at, "%Y-%m-%d %H:%M:%S"))
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_active'],
+                condition=Q(is_active=True),
+                name='unique_active_player_stats_group',
+            ),
+        ]
+
+
+ACTIVE_PLAYER_STATS_GROUP_KEY = 'active_player_stats_group'
+
+
+def get_active_player_stats_group_id() -> int | None:
+    """Get the id of the active player stats group from the cache, querying it if not cached."""
+
+    group_id = cache.get(ACTIVE_PLAYER_STATS_GROUP_KEY)
+
+    if group_id is None:
+        group_id = PlayerStatsGroup.objects.filter(
+            is_active=True
+        ).values_list('pk', flat=True).first()
+
+        if group_id is not None:
+            cache.set(ACTIVE_PLAYER_STATS_GROUP_KEY, group_id, timeout=None)
+
+    return group_id
+
+
+def invalidate_active_player_stats_group():
+    """Invalidate the cached active player stats group once the current transaction is committed."""
+
+    transaction.on_commit(lambda: cache.delete(ACTIVE_PLAYER_STATS_GROUP_KEY))
+
+
+def activate_player_stats_group(group: PlayerStatsGroup):
+    """
+    Mark the given group as completed and make it the active group in a single transaction, unless
+    a more recent group was activated in the meantime.
+    """
+
+    with transaction.atomic():
+        active_group = PlayerStatsGroup.objects.select_for_update().filter(is_active=True).first()
+
+        group.completed = True
+
+        if active_group is None or active_group.created_at <= group.created_at:
+            if active_group is not None:
+                active_group.is_active = False
+                active_group.save(update_fields=['is_active'])
+
+            group.is_active = True
+
+        group.save()
+
+        invalidate_active_player_stats_group()
+
 
 class PlayerStats(models.Model):
     """Precalculated fields for Player model"""
@@ -60,12 +131,32 @@ class PlayerStats(models.Model):
 
     leaderboard_points = models.IntegerField(help_text=_("Sum of leaderboard points"))
 
+    # Ranks per metric, null for players without a score counted on every track
+
+    total_score_rank = models.IntegerField(null=True, help_text=_("Rank by total score"))
+
+    total_rank_rank = models.IntegerField(null=True, help_text=_("Rank by total rank"))
+
+    total_standard_rank = models.IntegerField(null=True, help_text=_("Rank by total standard"))
+
+    total_record_ratio_rank = models.IntegerField(
+        null=True,
+        help_text=_("Rank by total record ratio"),
+    )
+
+    total_records_rank = models.IntegerField(null=True, help_text=_("Rank by total records"))
+
+    leaderboard_points_rank = models.IntegerField(
+        null=True,
+        help_text=_("Rank by leaderboard points"),
+    )
+
     @property
     def effective_score_count(self):
         """
         The actual number of scores counted in the tallies, including fallback scores when necessary
         """
-        return Track.objects.count() * (2 if self.is_lap is None else 1)
+        return get_track_count() * (2 if self.is_lap is None else 1)
 
     def __str__(self):
         return "Stats for %s - %s %s" % (
@@ -77,12 +168,54 @@ class PlayerStats(models.Model):
     class Meta:
         verbose_name = _("player stats")
         verbose_name_plural = _("player stats")
+        indexes = [
+            models.Index(
+                fields=['group', 'region', 'category', 'is_lap', 'total_score_rank'],
+                name='player_stats_score_rank_idx',
+            ),
+            models.Index(
+                fields=['group', 'region', 'category', 'is_lap', 'total_rank_rank'],
+                name='player_stats_rank_rank_idx',
+            ),
+            models.Index(
+                fields=['group', 'region', 'category', 'is_lap', 'total_standard_rank'],
+                name='player_stats_standard_rank_idx',
+            ),
+            models.Index(
+                fields=['group', 'region', 'category', 'is_lap', 'total_record_ratio_rank'],
+                name='player_stats_ratio_rank_idx',
+            ),
+            models.Index(
+                fields=['group', 'region', 'category', 'is_lap', 'total_records_rank'],
+                name='player_stats_records_rank_idx',
+            ),
+            models.Index(
+                fields=['group', 'region', 'category', 'is_lap', 'leaderboard_points_rank'],
+                name='player_stats_points_rank_idx',
+            ),
+        ]
+
+
+def query_stats_regions(region_player_ids: dict = None) -> tuple[Region]:
+    """Query ranked regions, only keeping those with any of the given players if specified"""
 
+    ranked_regions = tuple(Region.objects.filter(is_ranked=True).order_by('pk'))
 
-def generate_all_player_stats(group: PlayerStatsGroup):
-    """Recalculate player stats for all players"""
+    if region_player_ids is None:
+        return ranked_regions
+
+    # Regions without any of the given players would not produce any stats
+    return tuple(region for region in ranked_regions if region_player_ids.get(region.id))
 
-    track_ids = tuple(Track.objects.values_list('pk', flat=True))
+
+def calculate_player_stats(group: PlayerStatsGroup,
+                           region_player_ids: dict = None) -> list[PlayerStats]:
+    """
+    Calculate player stats for all players, or only for the given players of each region if a
+    mapping of region ids to player ids is specified
+    """
+
+    track_ids = get_track_ids()
     lap_modes = (False, True)
 
     mapped_standards = {
@@ -109,7 +242,14 @@ def generate_all_player_stats(group: PlayerStatsGroup):
             bucket = mapped_standards[standard['track']][standard['is_lap']][category]
             insort(bucket, standard, key=lambda standard: standard['level__value'])
 
-    ranked_regions = tuple(Region.objects.filter(is_ranked=True).order_by('pk'))
+    ranked_regions = query_stats_regions(region_player_ids)
+
+    # Precomputed ranks allow reading only the scores of the given players, instead of ranking
+    # every leaderboard
+    if region_player_ids is None:
+        ranked_scores = query_ranked_scores
+    else:
+        ranked_scores = query_precomputed_ranked_scores
 
     fallback_scores = {
         track_id: {
@@ -120,7 +260,7 @@ def generate_all_player_stats(group: PlayerStatsGroup):
     }
 
     for category in CategoryChoices.values:
-        bottom_scores = query_ranked_scores(category).distinct(
+        bottom_scores = ranked_scores(category).distinct(
             'track', 'is_lap'
         ).order_by(
             'track', 'is_lap', '-value'
@@ -147,6 +287,10 @@ def generate_all_player_stats(group: PlayerStatsGroup):
         for track_id in track_ids
     }
 
+    players = Player.objects.all()
+    if region_player_ids is not None:
+        players = players.filter(pk__in=set().union(*region_player_ids.values()))
+
     mapped_scores = {
         player_id: defaultdict(lambda: {
             category: {
@@ -158,19 +302,29 @@ def generate_all_player_stats(group: PlayerStatsGroup):
             }
             for category in CategoryChoices
         })
-        for player_id in Player.objects.values_list('pk', flat=True)
+        for player_id in players.values_list('pk', flat=True)
     }
 
     for region in ranked_regions:
+        if region_player_ids is None:
+            player_ids = mapped_scores.keys()
+        else:
+            player_ids = region_player_ids[region.id]
+
         for category in CategoryChoices.values:
-            scores = query_ranked_scores(category, region).order_by(
+            scores = ranked_scores(category, region).order_by(
                 'player', 'is_lap'
             ).values(
                 'player', 'track', 'is_lap', 'value', 'rank'
             )
+            if region_player_ids is not None:
+                # Ranks stay relative to every player, and the records are still needed for the
+                # record ratios
+                scores = scores.filter(Q(player__in=player_ids) | Q(rank=1))
             for score in scores:
-                bucket = mapped_scores[score['player']][region.id]
-                bucket[category][score['is_lap']][score['track']] = score
+                if score['player'] in player_ids:
+                    bucket = mapped_scores[score['player']][region.id]
+                    bucket[category][score['is_lap']][score['track']] = score
                 if score['rank'] == 1:
                     record_bucket = mapped_records[score['track']][score['is_lap']][category]
                     record_bucket[region.id] = score['value']
@@ -257,7 +411,275 @@ def generate_all_player_stats(group: PlayerStatsGroup):
 
                 stats_objects.append(overall_stats)
 
-    PlayerStats.objects.bulk_create(stats_objects)
+    return stats_objects
+
+
+PLAYER_STATS_RANKING_SQL = """
+UPDATE {player_stats} AS stats
+SET
+    total_score_rank = CASE WHEN ranked_stats.is_complete THEN ranked_stats.total_score_rank END,
+    total_rank_rank = CASE WHEN ranked_stats.is_complete THEN ranked_stats.total_rank_rank END,
+    total_standard_rank = CASE
+        WHEN ranked_stats.is_complete THEN ranked_stats.total_standard_rank
+    END,
+    total_record_ratio_rank = CASE
+        WHEN ranked_stats.is_complete THEN ranked_stats.total_record_ratio_rank
+    END,
+    total_records_rank = CASE
+        WHEN ranked_stats.is_complete THEN ranked_stats.total_records_rank
+    END,
+    leaderboard_points_rank = CASE
+        WHEN ranked_stats.is_complete THEN ranked_stats.leaderboard_points_rank
+    END
+FROM (
+    SELECT
+        id,
+        is_complete,
+        RANK() OVER (ranking ORDER BY total_score) AS total_score_rank,
+        RANK() OVER (ranking ORDER BY total_rank) AS total_rank_rank,
+        RANK() OVER (ranking ORDER BY total_standard) AS total_standard_rank,
+        RANK() OVER (ranking ORDER BY total_record_ratio DESC) AS total_record_ratio_rank,
+        RANK() OVER (ranking ORDER BY total_records) AS total_records_rank,
+        RANK() OVER (ranking ORDER BY leaderboard_points DESC) AS leaderboard_points_rank
+    FROM (
+        SELECT
+            *,
+            score_count = %(track_count)s * (CASE WHEN is_lap IS NULL THEN 2 ELSE 1 END)
+                AS is_complete
+        FROM {player_stats}
+        WHERE group_id = %(group)s
+    ) AS player_stats
+    WINDOW ranking AS (PARTITION BY region_id, category, is_lap, is_complete)
+) AS ranked_stats
+WHERE stats.id = ranked_stats.id
+"""
+
+
+def rank_player_stats(group: PlayerStatsGroup):
+    """
+    Store the rank of the player stats of the given group for every metric, among players with a
+    score counted on every track, so that rankings do not have to be calculated on every request.
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(PLAYER_STATS_RANKING_SQL.format(player_stats=PlayerStats._meta.db_table), {
+            'group': group.pk,
+            'track_count': get_track_count(),
+        })
+
+
+def generate_all_player_stats(group: PlayerStatsGroup, calculate=calculate_player_stats):
+    """Recalculate player stats for all players"""
+
+    PlayerStats.objects.bulk_create(calculate(group))
+
+    rank_player_stats(group)
+
+    activate_player_stats_group(group)
+
+
+def query_affected_region_player_ids(since) -> dict[int, set[int]]:
+    """
+    Query the players whose stats in each ranked region may have changed due to submissions
+    accepted since the given time, mapped by region id. This includes the submitting players,
+    every player of the same region ranked behind them on the same track, and players falling back
+    to the bottom score of a track when it or the regional record changed.
+    """
+
+    submissions = ScoreSubmission.objects.filter(
+        status=ScoreSubmissionStatus.ACCEPTED,
+        reviewed_at__gte=since,
+        score__isnull=False,
+    ).values('score', 'player', 'track', 'is_lap', 'category', 'value')
+
+    # A score affects the leaderboards of its own category and every less restricted one
+    touched_buckets = defaultdict(list)
+    for submission in submissions:
+        for category in CategoryChoices.values:
+            if category >= submission['category']:
+                bucket = touched_buckets[(submission['track'], submission['is_lap'], category)]
+                bucket.append(submission)
+
+    if not touched_buckets:
+        return dict()
+
+    all_player_ids = set(Player.objects.values_list('pk', flat=True))
+
+    ranked_region_player_ids = {
+        region.id: (
+            all_player_ids if region.type == RegionTypeChoices.WORLD
+            else set(query_region_players(region).values_list('pk', flat=True))
+        )
+        for region in Region.objects.filter(is_ranked=True)
+    }
+
+    affected_player_ids = defaultdict(set)
+
+    for (track_id, is_lap, category), new_scores in touched_buckets.items():
+        new_score_ids = [score['score'] for score in new_scores]
+
+        best_values = {
+            player_id: (best, previous_best)
+            for player_id, best, previous_best in Score.objects.filter(
+                track=track_id,
+                is_lap=is_lap,
+                category__lte=category,
+            ).values('player').annotate(
+                best=Min('value'),
+                previous_best=Min('value', filter=~Q(pk__in=new_score_ids)),
+            ).values_list('player', 'best', 'previous_best')
+        }
+
+        previous_worst = max(
+            (previous_best for _, previous_best in best_values.values()
+             if previous_best is not None),
+            default=None
+        )
+
+        # Ranks only change in the regions of the submitting players
+        thresholds = dict()
+        fallback_changed = False
+        record_region_ids = set()
+
+        for score in new_scores:
+            best, previous_best = best_values[score['player']]
+
+            # Scores which aren't personal bests don't change anyone's stats
+            if score['value'] != best:
+                continue
+
+            # The bottom score of the track moved, so the fallback score changed
+            if previous_best is None or previous_best == previous_worst:
+                fallback_changed = True
+
+            for region_id, region_player_ids in ranked_region_player_ids.items():
+                if score['player'] not in region_player_ids:
+                    continue
+
+                if region_id not in thresholds or score['value'] < thresholds[region_id]:
+                    thresholds[region_id] = score['value']
+
+                previous_record = min((
+                    best_values[player_id][1] for player_id in region_player_ids
+                    if player_id in best_values and best_values[player_id][1] is not None
+                ), default=None)
+
+                if previous_record is None or score['value'] <= previous_record:
+                    record_region_ids.add(region_id)
+
+        for region_id, threshold in thresholds.items():
+            region_player_ids = ranked_region_player_ids[region_id]
+            affected_player_ids[region_id].update(
+                player_id for player_id, (best, _) in best_values.items()
+                if best >= threshold and player_id in region_player_ids
+            )
+
+        # Players without a score on the track rely on the fallback score and regional record
+        for region_id, region_player_ids in ranked_region_player_ids.items():
+            if fallback_changed or region_id in record_region_ids:
+                affected_player_ids[region_id].update(region_player_ids - best_values.keys())
+
+    return dict(affected_player_ids)
+
+
+PLAYER_STATS_COPY_SQL = """
+INSERT INTO {player_stats} (group_id, {columns})
+SELECT %(group)s, {columns}
+FROM {player_stats}
+WHERE group_id = %(previous_group)s AND (player_id, region_id) NOT IN (
+    SELECT * FROM unnest(%(excluded_players)s::integer[], %(excluded_regions)s::integer[])
+)
+"""
+
+
+def copy_player_stats(previous_group: PlayerStatsGroup, group: PlayerStatsGroup,
+                      exclude_region_player_ids: dict = None):
+    """
+    Copy the player stats of a group into another one within the database, except for the given
+    players of each region.
+    """
+
+    columns = ', '.join(
+        connection.ops.quote_name(field.column) for field in PlayerStats._meta.concrete_fields
+        if field.attname not in ('id', 'group_id')
+    )
+
+    excluded = [
+        (player_id, region_id)
+        for region_id, player_ids in (exclude_region_player_ids or dict()).items()
+        for player_id in player_ids
+    ]
+
+    with connection.cursor() as cursor:
+        cursor.execute(PLAYER_STATS_COPY_SQL.format(
+            player_stats=PlayerStats._meta.db_table,
+            columns=columns,
+        ), {
+            'group': group.pk,
+            'previous_group': previous_group.pk,
+            'excluded_players': [player_id for player_id, _ in excluded],
+            'excluded_regions': [region_id for _, region_id in excluded],
+        })
+
+
+def generate_incremental_player_stats(group: PlayerStatsGroup, calculate=calculate_player_stats):
+    """
+    Recalculate player stats only for players affected by submissions accepted since the active
+    group was created, in the regions where they are affected, and copy every other row from that
+    group within the database.
+    """
+
+    previous_group = PlayerStatsGroup.objects.filter(is_active=True).first()
+
+    if previous_group is None:
+        generate_all_player_stats(group, calculate)
+        return
+
+    region_player_ids = query_affected_region_player_ids(previous_group.created_at)
+
+    copy_player_stats(previous_group, group, exclude_region_player_ids=region_player_ids)
+
+    if region_player_ids:
+        PlayerStats.objects.bulk_create(calculate(group, region_player_ids))
+
+    rank_player_stats(group)
+
+    activate_player_stats_group(group)
+
+
+# Number of most recent completed groups kept, including the active group
+PLAYER_STATS_GROUPS_KEPT = 2
+
+PLAYER_STATS_DELETE_BATCH_SIZE = 10000
+
+
+def delete_old_player_stats_groups(batch_size=PLAYER_STATS_DELETE_BATCH_SIZE):
+    """
+    Delete player stats groups older than the most recently completed ones, including groups which
+    never completed. Stats are deleted in batches, each in its own transaction, so that deleting
+    large groups never holds locks for long.
+    """
+
+    kept_dates = list(PlayerStatsGroup.objects.filter(
+        completed=True
+    ).order_by('-created_at').values_list('created_at', flat=True)[:PLAYER_STATS_GROUPS_KEPT])
+
+    if not kept_dates:
+        return
+
+    old_groups = PlayerStatsGroup.objects.filter(
+        created_at__lt=kept_dates[-1],
+        is_active=False,
+    )
+
+    while True:
+        stats_ids = list(PlayerStats.objects.filter(
+            group__in=old_groups
+        ).values_list('pk', flat=True)[:batch_size])
+
+        if not stats_ids:
+            break
+
+        PlayerStats.objects.filter(pk__in=stats_ids).delete()
 
-    group.completed = True
-    group.save()
+    old_groups.delete()
@@ -0,0 +1,202 @@
+import numpy as np
+
+from django.db.models import Q
+
+from timetrials.models.categories import CategoryChoices
+from timetrials.models.players import Player
+from timetrials.models.standards import Standard
+from timetrials.models.stats.player_stats import PlayerStats, PlayerStatsGroup, query_stats_regions
+from timetrials.models.tracks import get_track_ids
+from timetrials.queries import query_precomputed_ranked_scores, query_ranked_scores
+
+
+LAP_MODES = (False, True)
+
+
+def map_standard_thresholds(track_ids: tuple) -> dict:
+    """
+    Map each category to arrays of standard thresholds and level values per lap mode and track.
+    Thresholds are made non-decreasing so that the first standard a score qualifies for, in level
+    order, can be found with a binary search.
+    """
+
+    track_index = {track_id: index for index, track_id in enumerate(track_ids)}
+
+    mapped_standards = dict()
+
+    for category in CategoryChoices.values:
+        buckets = [[list() for _ in track_ids] for _ in LAP_MODES]
+
+        standards = Standard.objects.filter(
+            category__lte=category,
+            level__is_legacy=True,
+        ).distinct(
+            'track', 'is_lap', 'level'
+        ).order_by(
+            'track', 'is_lap', 'level', '-category'
+        ).values('track', 'is_lap', 'level__value', 'value')
+        for standard in standards:
+            buckets[standard['is_lap']][track_index[standard['track']]].append(standard)
+
+        mapped_standards[category] = [
+            [
+                (
+                    np.maximum.accumulate(np.array(
+                        [np.inf if std['value'] is None else std['value'] for std in bucket],
+                        dtype=np.float64,
+                    )),
+                    np.array([std['level__value'] for std in bucket], dtype=np.int64),
+                )
+                for bucket in (
+                    sorted(bucket, key=lambda standard: standard['level__value'])
+                    for bucket in lap_buckets
+                )
+            ]
+            for lap_buckets in buckets
+        ]
+
+    return mapped_standards
+
+
+def calculate_player_stats_vectorized(group: PlayerStatsGroup,
+                                      region_player_ids: dict = None) -> list[PlayerStats]:
+    """
+    Calculate the same player stats as `calculate_player_stats` using a matrix of players by lap
+    mode by track for each region and category, with sums done as column reductions.
+    """
+
+    track_ids = get_track_ids()
+    track_index = {track_id: index for index, track_id in enumerate(track_ids)}
+
+    players = Player.objects.order_by('pk')
+    if region_player_ids is not None:
+        players = players.filter(pk__in=set().union(*region_player_ids.values()))
+    player_array = np.array(players.values_list('pk', flat=True), dtype=np.int64)
+
+    shape = (len(player_array), len(LAP_MODES), len(track_ids))
+
+    mapped_standards = map_standard_thresholds(track_ids)
+
+    # Precomputed ranks allow reading only the scores of the given players, instead of ranking
+    # every leaderboard
+    ranked_scores = (
+        query_ranked_scores if region_player_ids is None else query_precomputed_ranked_scores
+    )
+
+    fallback_values = dict()
+    fallback_ranks = dict()
+
+    for category in CategoryChoices.values:
+        fallback_values[category] = np.zeros(shape[1:], dtype=np.int64)
+        fallback_ranks[category] = np.zeros(shape[1:], dtype=np.int64)
+
+        bottom_scores = ranked_scores(category).distinct(
+            'track', 'is_lap'
+        ).order_by(
+            'track', 'is_lap', '-value'
+        ).values_list(
+            'track', 'is_lap', 'value', 'rank'
+        )
+        for track_id, is_lap, value, rank in bottom_scores:
+            fallback_values[category][int(is_lap), track_index[track_id]] = value + 1
+            fallback_ranks[category][int(is_lap), track_index[track_id]] = rank + 1
+
+    stats_objects = list()
+
+    for region in query_stats_regions(region_player_ids):
+        # Players only get stats for a region once they have a score in any of its categories
+        has_region_scores = np.zeros(shape[0], dtype=bool)
+        region_stats = dict()
+
+        for category in CategoryChoices.values:
+            values = np.broadcast_to(fallback_values[category], shape).copy()
+            ranks = np.broadcast_to(fallback_ranks[category], shape).copy()
+            counted = np.zeros(shape, dtype=bool)
+            records = np.zeros(shape[1:], dtype=np.int64)
+
+            region_scores = ranked_scores(category, region)
+            if region_player_ids is not None:
+                # Records are still needed for the record ratios
+                region_scores = region_scores.filter(
+                    Q(player__in=region_player_ids[region.id]) | Q(rank=1)
+                )
+
+            scores = np.array(
+                region_scores.values_list('player', 'track', 'is_lap', 'value', 'rank'),
+                dtype=np.int64,
+            ).reshape(-1, 5)
+
+            score_tracks = np.array(
+                [track_index[track_id] for track_id in scores[:, 1]], dtype=np.int64
+            )
+            score_laps = scores[:, 2]
+
+            is_record = scores[:, 4] == 1
+            records[score_laps[is_record], score_tracks[is_record]] = scores[is_record, 3]
+
+            score_players = np.searchsorted(player_array, scores[:, 0])
+            is_selected = score_players < len(player_array)
+            is_selected[is_selected] = (
+                player_array[score_players[is_selected]] == scores[is_selected, 0]
+            )
+
+            index = (
+                score_players[is_selected], score_laps[is_selected], score_tracks[is_selected]
+            )
+            values[index] = scores[is_selected, 3]
+            ranks[index] = scores[is_selected, 4]
+            counted[index] = True
+            has_region_scores[score_players[is_selected]] = True
+
+            for lap, is_lap in enumerate(LAP_MODES):
+                lap_values = values[:, lap, :]
+                lap_ranks = ranks[:, lap, :]
+
+                total_standard = np.zeros(shape[0], dtype=np.int64)
+                total_record_ratio = np.zeros(shape[0], dtype=np.float64)
+
+                # Floating point sums are accumulated in track order to match the Python engine
+                for track in range(shape[2]):
+                    thresholds, levels = mapped_standards[category][lap][track]
+                    total_standard += levels[
+                        np.searchsorted(thresholds, lap_values[:, track], side='left')
+                    ]
+                    total_record_ratio += records[lap, track] / lap_values[:, track]
+
+                region_stats[(category, is_lap)] = {
+                    'score_count': counted[:, lap, :].sum(axis=1),
+                    'total_score': lap_values.sum(axis=1),
+                    'total_rank': lap_ranks.sum(axis=1),
+                    'total_standard': total_standard,
+                    'total_record_ratio': total_record_ratio,
+                    'total_records': (lap_ranks == 1).sum(axis=1),
+                    'leaderboard_points': np.maximum(11 - lap_ranks, 0).sum(axis=1),
+                }
+
+            course_stats = region_stats[(category, False)]
+            lap_stats = region_stats[(category, True)]
+            region_stats[(category, None)] = {
+                field: course_stats[field] + lap_stats[field] for field in course_stats
+            }
+
+        if region_player_ids is not None:
+            has_region_scores &= np.isin(player_array, list(region_player_ids[region.id]))
+
+        for index in np.flatnonzero(has_region_scores):
+            for (category, is_lap), stats in region_stats.items():
+                stats_objects.append(PlayerStats(
+                    group=group,
+                    player_id=int(player_array[index]),
+                    region_id=region.id,
+                    category=category,
+                    is_lap=is_lap,
+                    score_count=int(stats['score_count'][index]),
+                    total_score=int(stats['total_score'][index]),
+                    total_rank=int(stats['total_rank'][index]),
+                    total_standard=int(stats['total_standard'][index]),
+                    total_record_ratio=float(stats['total_record_ratio'][index]),
+                    total_records=int(stats['total_records'][index]),
+                    leaderboard_points=int(stats['leaderboard_points'][index]),
+                ))
+
+    return stats_objects
@@ -1,15 +1,17 @@
 from bisect import insort
 from functools import reduce
 
-from django.db import models, transaction
+from django.db import connection, models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from timetrials.models.categories import CategoryChoices
-from timetrials.models.regions import Region
+from timetrials.models.players import Player
+from timetrials.models.regions import Region, RegionClosure
 from timetrials.models.scores import Score
-from timetrials.models.standards import Standard
-from timetrials.models.tracks import Track
-from timetrials.queries import query_ranked_scores, query_records, query_region_players
+from timetrials.models.standards import Standard, StandardLevel
+from timetrials.models.tracks import Track, get_track_count, get_track_ids
+from timetrials.queries import query_ranked_scores, query_records
 
 
 class TopScoreCountChoices(models.IntegerChoices):
@@ -20,7 +22,17 @@ class TopScoreCountChoices(models.IntegerChoices):
     TOP_10 = 10, _("Top 10 regional scores")
 
 
+class RegionStatsGroup(models.Model):
+    created_at = models.DateTimeField(default=timezone.now)
+    completed = models.BooleanField(default=False)
+
+    def __str__(self):
+        return str(timezone.datetime.strftime(self.created_at, "%Y-%m-%d %H:%M:%S"))
+
+
 class RegionStats(models.Model):
+    group = models.ForeignKey(RegionStatsGroup, related_name='stats', on_delete=models.CASCADE)
+
     region = models.ForeignKey(Region, related_name='stats', on_delete=models.CASCADE)
 
     # Category information
@@ -60,15 +72,24 @@ class RegionStats(models.Model):
 
     total_records = models.IntegerField(help_text=_("Number of records"))
 
-    @property
-    def effective_score_count(self):
-        """
-        The actual number of scores counted in the tallies, including fallback scores when necessary
-        """
-        if self.top_score_count == TopScoreCountChoices.ALL:
-            return self.score_count
-        else:
-            return Track.objects.count() * self.top_score_count * (2 if self.is_lap is None else 1)
+    # Ranking
+
+    average_rank = models.FloatField(null=True, help_text=_("Average rank of counted scores"))
+
+    average_standard = models.FloatField(
+        null=True,
+        help_text=_("Average standard of counted scores"),
+    )
+
+    average_record_ratio = models.FloatField(
+        null=True,
+        help_text=_("Average record ratio of counted scores"),
+    )
+
+    rank = models.IntegerField(
+        null=True,
+        help_text=_("Rank by average rank among regions of the same type, null without scores"),
+    )
 
     def __str__(self):
         return "Region stats for %s - %s %s" % (
@@ -80,9 +101,17 @@ class RegionStats(models.Model):
     class Meta:
         verbose_name = _("region stats")
         verbose_name_plural = _("region stats")
+        indexes = [
+            models.Index(
+                fields=['group', 'top_score_count', 'category', 'is_lap', 'rank'],
+                name='region_stats_ranking_idx',
+            ),
+        ]
+
 
+def generate_all_region_stats(group: RegionStatsGroup):
+    """Recalculate region stats for all regions"""
 
-def generate_all_region_stats():
     mapped_standards = dict()
 
     for standard in Standard.objects.select_related('level').filter(level__is_legacy=True):
@@ -116,21 +145,27 @@ def generate_all_region_stats():
 
             category_bucket[record.is_lap] = record.value
 
+    # Each player's scores count towards their region and all of its ancestors
+    region_ancestors = dict()
+    for region_id, ancestor_id in RegionClosure.objects.values_list('descendant', 'ancestor'):
+        region_ancestors.setdefault(region_id, list()).append(ancestor_id)
+    player_ancestors = {
+        player_id: region_ancestors[region_id]
+        for player_id, region_id in Player.objects.filter(
+            region__isnull=False
+        ).values_list('pk', 'region')
+    }
+
     mapped_scores = dict()
 
     for category in CategoryChoices.values:
         scores = query_ranked_scores(category).order_by('track', 'is_lap', 'value')
 
-        for region in Region.objects.all():
-            region_players = query_region_players(region).values_list('pk', flat=True)
-
-            for score in scores:
-                if score.player_id not in region_players:
-                    continue
-
-                if region.id not in mapped_scores:
-                    mapped_scores[region.id] = dict()
-                region_bucket = mapped_scores[region.id]
+        for score in scores:
+            for region_id in player_ancestors.get(score.player_id, ()):
+                if region_id not in mapped_scores:
+                    mapped_scores[region_id] = dict()
+                region_bucket = mapped_scores[region_id]
 
                 if category not in region_bucket:
                     region_bucket[category] = dict()
@@ -172,116 +207,413 @@ def generate_all_region_stats():
             fallback_score.is_fallback = True
             lap_bucket[score.track_id] = fallback_score
 
-    track_ids = list(Track.objects.values_list('pk', flat=True))
+    track_ids = list(get_track_ids())
 
-    RegionStats.objects.all().delete()
+    stats_objects = list()
 
     for region_id, region_bucket in mapped_scores.items():
-        with transaction.atomic():
-            for category, category_bucket in region_bucket.items():
-                for top_score_count in TopScoreCountChoices.values:
-                    overall_stats = RegionStats(
+        for category, category_bucket in region_bucket.items():
+            for top_score_count in TopScoreCountChoices.values:
+                overall_stats = RegionStats(
+                    group=group,
+                    region_id=region_id,
+                    top_score_count=top_score_count,
+                    category=category,
+                    is_lap=None,
+                )
+                overall_stats.participation_count = 0
+                overall_stats.score_count = 0
+                overall_stats.total_score = 0
+                overall_stats.total_rank = 0
+                overall_stats.total_standard = 0
+                overall_stats.total_record_ratio = 0
+                overall_stats.total_records = 0
+
+                for is_lap, lap_bucket in category_bucket.items():
+                    stats = RegionStats(
+                        group=group,
                         region_id=region_id,
                         top_score_count=top_score_count,
                         category=category,
-                        is_lap=None,
+                        is_lap=is_lap,
                     )
-                    overall_stats.participation_count = 0
-                    overall_stats.score_count = 0
-                    overall_stats.total_score = 0
-                    overall_stats.total_rank = 0
-                    overall_stats.total_standard = 0
-                    overall_stats.total_record_ratio = 0
-                    overall_stats.total_records = 0
-
-                    for is_lap, lap_bucket in category_bucket.items():
-                        stats = RegionStats(
-                            region_id=region_id,
-                            top_score_count=top_score_count,
-                            category=category,
-                            is_lap=is_lap,
-                        )
-
-                        full_bucket = {track_id: list() for track_id in track_ids}
-
-                        for track_id, bucket in full_bucket.items():
-                            bucket.extend(lap_bucket.get(track_id, list()))
-                            missing = top_score_count - len(bucket)
-                            while missing > 0:
-                                bucket.append(fallback_scores[category][is_lap][track_id])
-                                missing -= 1
-
-                        stats.participation_count = len(list(filter(
-                            lambda bucket: len(bucket) >= top_score_count, lap_bucket.values()
-                        )))
-                        stats.score_count = reduce(
-                            lambda total, bucket: total + (
-                                min(len(bucket), top_score_count) if top_score_count > 0
-                                else len(bucket)
-                            ),
-                            lap_bucket.values(),
-                            0
-                        )
-                        stats.total_score = reduce(
-                            lambda total, bucket: total + reduce(
-                                lambda total, score: total + score.value,
-                                bucket[:top_score_count] if top_score_count > 0 else bucket,
-                                0
-                            ),
-                            full_bucket.values(),
-                            0
-                        )
-                        stats.total_rank = reduce(
-                            lambda total, bucket: total + reduce(
-                                lambda total, score: total + score.rank,
-                                bucket[:top_score_count] if top_score_count > 0 else bucket,
-                                0
-                            ),
-                            full_bucket.values(),
+
+                    full_bucket = {track_id: list() for track_id in track_ids}
+
+                    for track_id, bucket in full_bucket.items():
+                        bucket.extend(lap_bucket.get(track_id, list()))
+                        missing = top_score_count - len(bucket)
+                        while missing > 0:
+                            bucket.append(fallback_scores[category][is_lap][track_id])
+                            missing -= 1
+
+                    stats.participation_count = len(list(filter(
+                        lambda bucket: len(bucket) >= top_score_count, lap_bucket.values()
+                    )))
+                    stats.score_count = reduce(
+                        lambda total, bucket: total + (
+                            min(len(bucket), top_score_count) if top_score_count > 0
+                            else len(bucket)
+                        ),
+                        lap_bucket.values(),
+                        0
+                    )
+                    stats.total_score = reduce(
+                        lambda total, bucket: total + reduce(
+                            lambda total, score: total + score.value,
+                            bucket[:top_score_count] if top_score_count > 0 else bucket,
                             0
-                        )
-                        stats.total_standard = reduce(
-                            lambda total, bucket: total + reduce(
-                                lambda total, score: total + next(filter(
-                                    lambda std: std.value is None or std.value >= score.value,
-                                    mapped_standards[score.track_id][category][score.is_lap]
-                                )).level.value,
-                                bucket[:top_score_count] if top_score_count > 0 else bucket,
-                                0
-                            ),
-                            full_bucket.values(),
+                        ),
+                        full_bucket.values(),
+                        0
+                    )
+                    stats.total_rank = reduce(
+                        lambda total, bucket: total + reduce(
+                            lambda total, score: total + score.rank,
+                            bucket[:top_score_count] if top_score_count > 0 else bucket,
                             0
-                        )
-                        stats.total_record_ratio = reduce(
-                            lambda total, bucket: total + reduce(
-                                lambda total, score:
-                                    total
-                                    + mapped_records[score.track_id][category][score.is_lap]
-                                    / score.value,
-                                bucket[:top_score_count] if top_score_count > 0 else bucket,
-                                0
-                            ),
-                            full_bucket.values(),
+                        ),
+                        full_bucket.values(),
+                        0
+                    )
+                    stats.total_standard = reduce(
+                        lambda total, bucket: total + reduce(
+                            lambda total, score: total + next(filter(
+                                lambda std: std.value is None or std.value >= score.value,
+                                mapped_standards[score.track_id][category][score.is_lap]
+                            )).level.value,
+                            bucket[:top_score_count] if top_score_count > 0 else bucket,
                             0
-                        )
-                        stats.total_records = reduce(
-                            lambda total, bucket: total + (
-                                1 if any(score.rank == 1 for score in (
-                                    bucket[:top_score_count] if top_score_count > 0 else bucket
-                                )) else 0
-                            ),
-                            full_bucket.values(),
+                        ),
+                        full_bucket.values(),
+                        0
+                    )
+                    stats.total_record_ratio = reduce(
+                        lambda total, bucket: total + reduce(
+                            lambda total, score:
+                                total
+                                + mapped_records[score.track_id][category][score.is_lap]
+                                / score.value,
+                            bucket[:top_score_count] if top_score_count > 0 else bucket,
                             0
-                        )
+                        ),
+                        full_bucket.values(),
+                        0
+                    )
+                    stats.total_records = reduce(
+                        lambda total, bucket: total + (
+                            1 if any(score.rank == 1 for score in (
+                                bucket[:top_score_count] if top_score_count > 0 else bucket
+                            )) else 0
+                        ),
+                        full_bucket.values(),
+                        0
+                    )
+
+                    overall_stats.participation_count += stats.participation_count
+                    overall_stats.score_count += stats.score_count
+                    overall_stats.total_score += stats.total_score
+                    overall_stats.total_rank += stats.total_rank
+                    overall_stats.total_standard += stats.total_standard
+                    overall_stats.total_record_ratio += stats.total_record_ratio
+                    overall_stats.total_records += stats.total_records
+
+                    stats_objects.append(stats)
+
+                stats_objects.append(overall_stats)
+
+    RegionStats.objects.bulk_create(stats_objects)
+
+    rank_region_stats(group)
+
+    group.completed = True
+    group.save()
+
+
+# Set-based equivalent of `generate_all_region_stats`. Each player's personal best is ranked per
+# category, fanned out to every ancestor of the player's region and numbered by value within each
+# region, so that the top N scores of a track are those with a position of at most N. Tracks short
+# of N regional scores are padded with the fallback score, i.e. one more than the bottom score.
+REGION_STATS_SQL = """
+WITH categories (category) AS (
+    SELECT unnest(%(categories)s::integer[])
+),
+top_score_counts (top_score_count) AS (
+    SELECT unnest(%(top_score_counts)s::integer[])
+),
+personal_bests AS (
+    SELECT DISTINCT ON (categories.category, score.player_id, score.track_id, score.is_lap)
+        categories.category, score.player_id, score.track_id, score.is_lap, score.value
+    FROM {score} score
+    JOIN categories ON score.category <= categories.category
+    ORDER BY categories.category, score.player_id, score.track_id, score.is_lap, score.value
+),
+ranked_scores AS (
+    SELECT
+        personal_bests.*,
+        RANK() OVER (
+            PARTITION BY category, track_id, is_lap ORDER BY value
+        ) AS rank
+    FROM personal_bests
+),
+bottom_scores AS (
+    SELECT
+        category, track_id, is_lap,
+        MIN(value) AS record,
+        MAX(value) + 1 AS fallback_value,
+        MAX(rank) + 1 AS fallback_rank
+    FROM ranked_scores
+    GROUP BY category, track_id, is_lap
+),
+standard_scores AS (
+    SELECT
+        ranked_scores.*,
+        standard.value AS standard,
+        bottom_scores.record::double precision / ranked_scores.value AS record_ratio
+    FROM ranked_scores
+    JOIN bottom_scores USING (category, track_id, is_lap)
+    LEFT JOIN LATERAL (
+        SELECT level.value
+        FROM {standard} standard
+        JOIN {standard_level} level ON level.id = standard.level_id
+        WHERE level.is_legacy
+        AND standard.track_id = ranked_scores.track_id
+        AND standard.is_lap = ranked_scores.is_lap
+        AND (standard.value IS NULL OR standard.value >= ranked_scores.value)
+        ORDER BY COALESCE(standard.value, %(catch_all_threshold)s)
+        LIMIT 1
+    ) standard ON TRUE
+),
+fallback_scores AS (
+    SELECT
+        bottom_scores.*,
+        standard.value AS fallback_standard,
+        bottom_scores.record::double precision / bottom_scores.fallback_value
+            AS fallback_record_ratio
+    FROM bottom_scores
+    LEFT JOIN LATERAL (
+        SELECT level.value
+        FROM {standard} standard
+        JOIN {standard_level} level ON level.id = standard.level_id
+        WHERE level.is_legacy
+        AND standard.track_id = bottom_scores.track_id
+        AND standard.is_lap = bottom_scores.is_lap
+        AND (standard.value IS NULL OR standard.value >= bottom_scores.fallback_value)
+        ORDER BY COALESCE(standard.value, %(catch_all_threshold)s)
+        LIMIT 1
+    ) standard ON TRUE
+),
+region_scores AS (
+    SELECT
+        region_closure.ancestor_id AS region_id,
+        standard_scores.*,
+        ROW_NUMBER() OVER region_track AS position,
+        COUNT(*) OVER region_track AS track_score_count
+    FROM standard_scores
+    JOIN {player} player ON player.id = standard_scores.player_id
+    JOIN {region_closure} region_closure ON region_closure.descendant_id = player.region_id
+    WINDOW region_track AS (
+        PARTITION BY region_closure.ancestor_id, category, track_id, is_lap
+        ORDER BY value
+        ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+    )
+),
+region_lap_modes AS (
+    SELECT DISTINCT region_id, category, is_lap FROM region_scores
+),
+region_track_totals AS (
+    SELECT
+        region_scores.region_id,
+        region_scores.category,
+        region_scores.is_lap,
+        region_scores.track_id,
+        top_score_counts.top_score_count,
+        MAX(region_scores.track_score_count) AS track_score_count,
+        COUNT(*) AS score_count,
+        SUM(region_scores.value) AS total_score,
+        SUM(region_scores.rank) AS total_rank,
+        SUM(region_scores.standard) AS total_standard,
+        SUM(region_scores.record_ratio) AS total_record_ratio,
+        BOOL_OR(region_scores.rank = 1) AS has_record
+    FROM region_scores
+    JOIN top_score_counts
+        ON top_score_counts.top_score_count = 0
+        OR region_scores.position <= top_score_counts.top_score_count
+    GROUP BY
+        region_scores.region_id,
+        region_scores.category,
+        region_scores.is_lap,
+        region_scores.track_id,
+        top_score_counts.top_score_count
+),
+track_totals AS (
+    SELECT
+        region_lap_modes.region_id,
+        region_lap_modes.category,
+        region_lap_modes.is_lap,
+        track.id AS track_id,
+        top_score_counts.top_score_count,
+        region_track_totals.track_score_count,
+        COALESCE(region_track_totals.score_count, 0) AS score_count,
+        COALESCE(region_track_totals.total_score, 0) AS total_score,
+        COALESCE(region_track_totals.total_rank, 0) AS total_rank,
+        COALESCE(region_track_totals.total_standard, 0) AS total_standard,
+        COALESCE(region_track_totals.total_record_ratio, 0) AS total_record_ratio,
+        COALESCE(region_track_totals.has_record, FALSE) AS has_record
+    FROM region_lap_modes
+    CROSS JOIN {track} track
+    CROSS JOIN top_score_counts
+    LEFT JOIN region_track_totals
+        ON region_track_totals.region_id = region_lap_modes.region_id
+        AND region_track_totals.category = region_lap_modes.category
+        AND region_track_totals.is_lap = region_lap_modes.is_lap
+        AND region_track_totals.track_id = track.id
+        AND region_track_totals.top_score_count = top_score_counts.top_score_count
+),
+padded_track_totals AS (
+    SELECT
+        track_totals.*,
+        GREATEST(track_totals.top_score_count - track_totals.score_count, 0) AS padding,
+        fallback_scores.fallback_value,
+        fallback_scores.fallback_rank,
+        fallback_scores.fallback_standard,
+        fallback_scores.fallback_record_ratio
+    FROM track_totals
+    LEFT JOIN fallback_scores USING (category, track_id, is_lap)
+)
+INSERT INTO {region_stats} (
+    group_id, region_id, top_score_count, category, is_lap, participation_count, score_count,
+    total_score, total_rank, total_standard, total_record_ratio, total_records
+)
+SELECT
+    %(group)s,
+    region_id,
+    top_score_count,
+    category,
+    is_lap,
+    COUNT(*) FILTER (WHERE track_score_count >= top_score_count),
+    SUM(score_count),
+    SUM(total_score + padding * fallback_value),
+    SUM(total_rank + padding * fallback_rank),
+    SUM(total_standard + padding * fallback_standard),
+    SUM(total_record_ratio + padding * fallback_record_ratio),
+    COUNT(*) FILTER (WHERE has_record)
+FROM padded_track_totals
+GROUP BY region_id, top_score_count, category, ROLLUP (is_lap)
+"""
+
+
+def generate_all_region_stats_sql(group: RegionStatsGroup):
+    """
+    Recalculate region stats for all regions with a single `INSERT ... SELECT` query, without
+    loading any score into Python.
+    """
+
+    sql = REGION_STATS_SQL.format(
+        region_closure=RegionClosure._meta.db_table,
+        score=Score._meta.db_table,
+        player=Player._meta.db_table,
+        standard=Standard._meta.db_table,
+        standard_level=StandardLevel._meta.db_table,
+        track=Track._meta.db_table,
+        region_stats=RegionStats._meta.db_table,
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'group': group.pk,
+            'categories': CategoryChoices.values,
+            'top_score_counts': TopScoreCountChoices.values,
+            'catch_all_threshold': 60*60*1000,
+        })
+
+    rank_region_stats(group)
+
+    group.completed = True
+    group.save()
+
+
+REGION_STATS_RANKING_SQL = """
+UPDATE {region_stats} AS stats
+SET
+    average_rank = ranked_stats.average_rank,
+    average_standard = ranked_stats.average_standard,
+    average_record_ratio = ranked_stats.average_record_ratio,
+    rank = CASE WHEN ranked_stats.score_count > 0 THEN ranked_stats.rank END
+FROM (
+    SELECT
+        averages.*,
+        RANK() OVER (
+            PARTITION BY
+                averages.region_type,
+                averages.top_score_count,
+                averages.category,
+                averages.is_lap,
+                averages.score_count > 0
+            ORDER BY averages.average_rank
+        ) AS rank
+    FROM (
+        SELECT
+            counts.id,
+            counts.region_type,
+            counts.top_score_count,
+            counts.category,
+            counts.is_lap,
+            counts.score_count,
+            counts.total_rank::double precision / counts.effective_score_count AS average_rank,
+            counts.total_standard::double precision
+                / counts.effective_score_count AS average_standard,
+            counts.total_record_ratio / counts.effective_score_count AS average_record_ratio
+        FROM (
+            SELECT
+                region_stats.*,
+                region.type AS region_type,
+                NULLIF(CASE
+                    WHEN region_stats.top_score_count = 0 THEN region_stats.score_count
+                    ELSE %(track_count)s * region_stats.top_score_count
+                        * (CASE WHEN region_stats.is_lap IS NULL THEN 2 ELSE 1 END)
+                END, 0) AS effective_score_count
+            FROM {region_stats} AS region_stats
+            JOIN {region} AS region ON region.id = region_stats.region_id
+            WHERE region_stats.group_id = %(group)s
+        ) AS counts
+    ) AS averages
+) AS ranked_stats
+WHERE stats.id = ranked_stats.id
+"""
+
+
+def rank_region_stats(group: RegionStatsGroup):
+    """
+    Store the averages of the region stats of the given group along with their rank among regions
+    of the same type, so that region rankings do not have to be calculated on every request.
+    """
+
+    sql = REGION_STATS_RANKING_SQL.format(
+        region=Region._meta.db_table,
+        region_stats=RegionStats._meta.db_table,
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'group': group.pk,
+            'track_count': get_track_count(),
+        })
+
+
+def delete_old_region_stats_groups():
+    """
+    Delete region stats groups older than the most recently completed one, including groups which
+    never completed.
+    """
 
-                        overall_stats.participation_count += stats.participation_count
-                        overall_stats.score_count += stats.score_count
-                        overall_stats.total_score += stats.total_score
-                        overall_stats.total_rank += stats.total_rank
-                        overall_stats.total_standard += stats.total_standard
-                        overall_stats.total_record_ratio += stats.total_record_ratio
-                        overall_stats.total_records += stats.total_records
+    latest_group = RegionStatsGroup.objects.filter(
+        completed=True
+    ).order_by('-created_at').first()
 
-                        stats.save()
+    if latest_group is None:
+        return
 
-                    overall_stats.save()
+    RegionStatsGroup.objects.filter(
+        created_at__lt=latest_group.created_at,
+    ).delete()
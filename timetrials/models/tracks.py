@@ -4,6 +4,7 @@ from django.utils.translation import gettext_lazy as _
 from multiselectfield import MultiSelectField
 
 from timetrials.models.categories import CategoryChoices
+from timetrials.versioned_cache import VersionedCache
 
 
 class TrackCup(models.Model):
@@ -45,3 +46,29 @@ class Track(models.Model):
     class Meta:
         verbose_name = _("track")
         verbose_name_plural = _("tracks")
+
+
+track_ids_cache = VersionedCache(
+    'track_ids', lambda: tuple(Track.objects.order_by('pk').values_list('pk', flat=True))
+)
+
+
+def get_track_ids() -> tuple[int, ...]:
+    """
+    Get the ids of every track from the in-process cache, which is shared with other processes
+    through the cache backend.
+    """
+
+    return track_ids_cache.get()
+
+
+def get_track_count() -> int:
+    """Get the number of tracks without querying the database when cached."""
+
+    return len(get_track_ids())
+
+
+def invalidate_track_ids():
+    """Invalidate the cached track ids once the current transaction is committed."""
+
+    track_ids_cache.invalidate()
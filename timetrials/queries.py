@@ -1,5 +1,8 @@
-from django.db.models import F, FloatField, OuterRef, Q, QuerySet, Subquery, Value, Window
+from django.db.models import (
+    F, FilteredRelation, FloatField, Q, QuerySet, Subquery, Value, Window
+)
 from django.db.models.functions import Cast, Rank
+from django.db.models.sql.constants import LOUTER
 
 from django_cte import With
 
@@ -9,8 +12,100 @@ from timetrials import models
 def query_region_players(region: models.Region):
     """Query players from a given region, including all sub-regions."""
 
-    return models.Player.objects.filter(
-        region__in=region.descendants(include_self=True).values_list('pk', flat=True)
+    return models.Player.objects.filter(region__ancestor_closures__ancestor=region)
+
+
+def query_personal_bests(category: models.CategoryChoices, date=None, **filters):
+    """
+    Query the primary keys of every player's best score on each track for a given category,
+    narrowed down by the given field lookups. Personal bests are read from the precomputed table
+    unless only scores set up to a given date should be considered.
+    """
+
+    if date is None:
+        return models.PersonalBest.objects.filter(
+            category=category,
+            **filters
+        ).values('score')
+
+    return models.Score.objects.distinct(
+        'player', 'track', 'is_lap'
+    ).order_by(
+        'player', 'track', 'is_lap', 'value'
+    ).filter(
+        category__lte=category,
+        date__lte=date,
+        **filters
+    ).values('pk')
+
+
+def query_track_ranked_scores(track: int,
+                              category: models.CategoryChoices,
+                              is_lap: bool,
+                              region: models.Region = None):
+    """
+    Query every player's best score on a track annotated with its precomputed rank, ordered by
+    rank. Only the world or a ranked region may be specified.
+    """
+
+    if region is None or region.type == models.RegionTypeChoices.WORLD:
+        return models.Score.objects.filter(
+            personal_bests__track=track,
+            personal_bests__is_lap=is_lap,
+            personal_bests__category=category,
+        ).annotate(
+            rank=F('personal_bests__rank')
+        ).order_by(
+            'rank', 'date'
+        )
+
+    return models.Score.objects.filter(
+        personal_bests__regional_ranks__region=region,
+        personal_bests__regional_ranks__track=track,
+        personal_bests__regional_ranks__is_lap=is_lap,
+        personal_bests__regional_ranks__category=category,
+    ).annotate(
+        rank=F('personal_bests__regional_ranks__rank')
+    ).order_by(
+        'rank', 'date'
+    )
+
+
+def query_player_ranked_scores(player: int,
+                               category: models.CategoryChoices,
+                               region: models.Region = None,
+                               is_lap: bool = None):
+    """
+    Query a player's best score on each track annotated with its precomputed rank. Only the world
+    or a ranked region may be specified, the rank being None in a region the player is not from.
+    """
+
+    # Conditions on personal bests must be applied in a single filter to use the same join
+    personal_best_filters = dict(
+        personal_bests__player=player,
+        personal_bests__category=category,
+    )
+    if is_lap is not None:
+        personal_best_filters['personal_bests__is_lap'] = is_lap
+
+    scores = models.Score.objects.filter(**personal_best_filters)
+
+    if region is None or region.type == models.RegionTypeChoices.WORLD:
+        return scores.annotate(rank=F('personal_bests__rank'))
+
+    regional_rank_condition = Q(
+        personal_bests__regional_ranks__region=region,
+        personal_bests__regional_ranks__category=category,
+    )
+    if is_lap is not None:
+        regional_rank_condition &= Q(personal_bests__regional_ranks__is_lap=is_lap)
+
+    return scores.annotate(
+        regional_rank=FilteredRelation(
+            'personal_bests__regional_ranks',
+            condition=regional_rank_condition,
+        ),
+        rank=F('regional_rank__rank'),
     )
 
 
@@ -32,7 +127,7 @@ def query_records(category: models.CategoryChoices, region: models.Region = None
 
     if region and region.type != models.RegionTypeChoices.WORLD:
         records = records.filter(
-            player__in=Subquery(query_region_players(region).values('pk'))
+            player__region__ancestor_closures__ancestor=region
         )
 
     return records
@@ -44,23 +139,15 @@ def query_ranked_scores(category: models.CategoryChoices, region: models.Region
     annotate each score's rank.
     """
 
-    player_records = models.Score.objects.distinct(
-        'player', 'track', 'is_lap'
-    ).order_by(
-        'player', 'track', 'is_lap', 'value'
-    ).filter(
-        category__lte=category,
-    ).values('pk')
-
     ranked_scores_query = models.Score.objects.order_by(
         'track', 'is_lap'
     ).filter(
-        pk__in=Subquery(player_records)
+        pk__in=Subquery(query_personal_bests(category))
     )
 
     if region and region.type != models.RegionTypeChoices.WORLD:
         ranked_scores_query = ranked_scores_query.filter(
-            player__in=Subquery(query_region_players(region).values('pk'))
+            player__region__ancestor_closures__ancestor=region
         )
 
     ranked_scores = With(
@@ -73,54 +160,88 @@ def query_ranked_scores(category: models.CategoryChoices, region: models.Region
     return ranked_scores.queryset().with_cte(ranked_scores)
 
 
+def query_precomputed_ranked_scores(category: models.CategoryChoices,
+                                    region: models.Region = None):
+    """
+    Query all players' personal bests across all tracks for a given category with their precomputed
+    rank, with the same values as `query_ranked_scores`. Only the world or a ranked region may be
+    specified.
+    """
+
+    if region is None or region.type == models.RegionTypeChoices.WORLD:
+        return models.PersonalBest.objects.filter(category=category)
+
+    return models.RegionalRank.objects.filter(
+        region=region,
+        category=category,
+    ).annotate(
+        player=F('personal_best__player')
+    )
+
+
 def annotate_scores_standard(scores: QuerySet, category: models.CategoryChoices, legacy=False):
     """
     Annotates each score within the queryset with the id of the highest standard level it qualifies
-    for given a category. Legacy standards may be used optionally.
+    for given a category. Legacy standards may be used optionally. The level is found by joining
+    the standard range containing the score.
     """
 
     return scores.annotate(
-        standard=Subquery(
-            models.Standard.objects.filter(
-                Q(value__gte=OuterRef('value')) | Q(value=None),
-                track=OuterRef('track'),
-                category__lte=category,
-                is_lap=OuterRef('is_lap'),
-                level__is_legacy=legacy,
-            ).order_by(
-                '-category',
-                'value'
-            ).values('level')[:1]
-        )
+        standard_range=FilteredRelation(
+            'track__standard_ranges',
+            condition=Q(
+                track__standard_ranges__is_lap=F('is_lap'),
+                track__standard_ranges__category=category,
+                track__standard_ranges__is_legacy=legacy,
+                track__standard_ranges__values__contains=F('value'),
+            ),
+        ),
+        standard=F('standard_range__level'),
     )
 
 
-def annotate_scores_record_ratio(scores: QuerySet,
-                                 category: models.CategoryChoices,
-                                 region: models.Region | None = None):
-    """Annotate each score within the queryset with its record ratio."""
+def query_record_values(category: models.CategoryChoices, region: models.Region = None):
+    """
+    Query the record value of each track and lap mode for a given category and region. Records of
+    the world and ranked regions are read from precomputed ranks.
+    """
 
-    records = models.Score.objects.distinct(
+    if region is None or region.type == models.RegionTypeChoices.WORLD:
+        records = models.PersonalBest.objects.filter(category=category, rank=1)
+
+    elif region.is_ranked:
+        records = models.RegionalRank.objects.filter(region=region, category=category, rank=1)
+
+    else:
+        records = models.Score.objects.filter(
+            category__lte=category,
+            player__region__ancestor_closures__ancestor=region,
+        )
+
+    return records.distinct(
         'track', 'is_lap'
     ).order_by(
         'track', 'is_lap', 'value'
-    ).filter(
-        category__lte=category
-    )
+    ).values('track', 'is_lap', 'value')
 
-    if region is not None:
-        if region.type != models.RegionTypeChoices.WORLD:
-            records = records.filter(
-                player__in=Subquery(query_region_players(region).values('pk'))
-            )
 
-    return scores.annotate(
-        record_ratio=Subquery(
-            models.Score.objects.filter(
-                pk__in=records.values('pk')
-            ).filter(
-                track=OuterRef('track'),
-                is_lap=OuterRef('is_lap')
-            ).values('value')
-        ) / Cast(F('value'), FloatField())
+def annotate_scores_record_ratio(scores: QuerySet,
+                                 category: models.CategoryChoices,
+                                 region: models.Region | None = None):
+    """
+    Annotate each score within the queryset with its record ratio. Records are queried once and
+    joined to the scores by track and lap mode.
+    """
+
+    records = With(query_record_values(category, region), name='records')
+
+    return records.join(
+        scores,
+        track=records.col.track_id,
+        is_lap=records.col.is_lap,
+        _join_type=LOUTER,
+    ).with_cte(
+        records
+    ).annotate(
+        record_ratio=records.col.value / Cast(F('value'), FloatField())
     )
@@ -0,0 +1,259 @@
+from functools import cached_property
+from operator import itemgetter
+
+from rest_framework.response import Response
+
+from timetrials.models.regions import get_region_player_counts
+from timetrials.models.tracks import get_track_count
+from timetrials.serializers import CategoryField, TopScoreCountField
+
+
+# Conversions matching the representation of the equivalent DRF fields
+
+def to_int(value):
+    return None if value is None else int(value)
+
+
+def to_float(value):
+    return None if value is None else float(value)
+
+
+def to_date(value):
+    return None if value is None else value.isoformat()
+
+
+to_category = CategoryField().to_representation
+
+to_top_score_count = TopScoreCountField().to_representation
+
+
+# Fields
+
+class RowField:
+
+    def __init__(self, source: str = None, convert=None):
+        """
+        Parameters
+        ----------
+        source : str
+            The lookup of the value in the row, defaults to the name of the field
+        convert : callable
+            Function converting the value to its representation, or None to use the value as is
+        """
+        self.source = source
+        self.convert = convert
+
+    def compile(self, name: str, prefix: str, serializer: 'RowSerializer'):
+        """Return the lookups this field needs and a function reading its representation."""
+
+        key = prefix + (self.source or name)
+        convert = self.convert
+
+        if convert is None:
+            return [key], itemgetter(key)
+
+        return [key], lambda row: convert(row[key])
+
+
+class RowMethodField(RowField):
+
+    def __init__(self, *sources: str):
+        """
+        Parameters
+        ----------
+        sources : str
+            The lookups of the values passed to the `get_<name>` method of the serializer
+        """
+        super().__init__()
+        self.sources = sources
+
+    def compile(self, name: str, prefix: str, serializer: 'RowSerializer'):
+        keys = [prefix + source for source in self.sources]
+        method = getattr(serializer, f'get_{name}')
+
+        return keys, lambda row: method(*(row[key] for key in keys))
+
+
+class RowSerializer:
+    """
+    Serialize rows from `QuerySet.values()` with the same output as a regular serializer, without
+    instantiating models or going through DRF fields. Fields are compiled once per serializer into
+    functions reading values directly from the rows. A serializer may be nested as a field of
+    another one, in which case its source is the lookup of the related model.
+    """
+
+    fields: dict[str, RowField] = {}
+
+    def __init__(self, source: str = None):
+        self.source = source
+
+    def compile_fields(self, prefix: str):
+        """Return the lookups of every field and a function reading the representation of a row."""
+
+        lookups = list()
+        readers = list()
+
+        for field_name, field in self.fields.items():
+            field_lookups, reader = field.compile(field_name, prefix, self)
+            lookups.extend(field_lookups)
+            readers.append((field_name, reader))
+
+        def read(row):
+            return {field_name: reader(row) for field_name, reader in readers}
+
+        return list(dict.fromkeys(lookups)), read
+
+    def compile(self, name: str, prefix: str, serializer: 'RowSerializer'):
+        # Nested serializers are declared once per class, so a new instance keeps any state local
+        # to the parent serializer instance
+        nested = self.__class__(self.source)
+        return nested.compile_fields(f'{prefix}{self.source or name}__')
+
+    @cached_property
+    def compiled(self):
+        return self.compile_fields('')
+
+    @property
+    def lookups(self) -> list[str]:
+        return self.compiled[0]
+
+    def values(self, queryset):
+        """Query only the values needed by this serializer."""
+        return queryset.values(*self.lookups)
+
+    def to_representation(self, row: dict) -> dict:
+        return self.compiled[1](row)
+
+    def serialize(self, queryset) -> list[dict]:
+        """Serialize every row of the queryset."""
+        return list(map(self.to_representation, self.values(queryset)))
+
+
+class RowSerializerMixin:
+    """Serialize list responses with `row_serializer_class` instead of the regular serializer."""
+
+    row_serializer_class: type[RowSerializer] = None
+
+    def get_row_serializer(self) -> RowSerializer:
+        return self.row_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(self.get_row_serializer().serialize(queryset))
+
+
+# Regions
+
+class RegionRowSerializer(RowSerializer):
+    fields = {
+        'id': RowField(),
+        'type': RowField(),
+        'name': RowField(),
+        'code': RowField(),
+        'parent': RowField(),
+        'is_ranked': RowField(),
+        'player_count': RowMethodField('id'),
+    }
+
+    # Player counts of all regions, fetched once per serializer instance
+    player_counts = None
+
+    def get_player_count(self, region_id: int) -> int:
+        if self.player_counts is None:
+            self.player_counts = get_region_player_counts()
+        return self.player_counts.get(region_id, 0)
+
+
+class RegionStatsRowSerializer(RowSerializer):
+    fields = {
+        'region': RegionRowSerializer(),
+        'top_score_count': RowField(convert=to_top_score_count),
+        'category': RowField(convert=to_category),
+        'is_lap': RowField(),
+        'rank': RowField(convert=to_int),
+        'participation_count': RowField(),
+        'score_count': RowField(),
+        'total_score': RowField(),
+        'total_rank': RowField(),
+        'average_rank': RowMethodField('average_rank'),
+        'total_standard': RowField(),
+        'average_standard': RowMethodField('average_standard'),
+        'total_record_ratio': RowField(convert=to_float),
+        'average_record_ratio': RowMethodField('average_record_ratio'),
+        'total_records': RowField(),
+    }
+
+    def get_average_rank(self, average_rank: float) -> str:
+        return f"{average_rank:.08}"
+
+    def get_average_standard(self, average_standard: float) -> str:
+        return f"{average_standard:.08}"
+
+    def get_average_record_ratio(self, average_record_ratio: float) -> str:
+        return f"{average_record_ratio:.08}"
+
+
+# Players
+
+class PlayerBasicRowSerializer(RowSerializer):
+    fields = {
+        'id': RowField(),
+        'name': RowField(),
+        'region': RowField(),
+        'user': RowField(),
+        'alias': RowField(),
+        'joined_date': RowField(convert=to_date),
+        'last_activity': RowField(convert=to_date),
+    }
+
+
+class PlayerStatsRowSerializer(RowSerializer):
+    fields = {
+        'rank': RowField(convert=to_int),
+        'player': PlayerBasicRowSerializer(),
+        'region': RowField(),
+        'category': RowField(convert=to_category),
+        'is_lap': RowField(),
+        'score_count': RowField(),
+        'total_score': RowField(),
+        'total_rank': RowField(),
+        'average_rank': RowMethodField('total_rank', 'is_lap'),
+        'total_standard': RowField(),
+        'average_standard': RowMethodField('total_standard', 'is_lap'),
+        'total_record_ratio': RowField(convert=to_float),
+        'average_record_ratio': RowMethodField('total_record_ratio', 'is_lap'),
+        'total_records': RowField(),
+        'leaderboard_points': RowField(),
+    }
+
+    def get_effective_score_count(self, is_lap: bool | None) -> int:
+        return get_track_count() * (2 if is_lap is None else 1)
+
+    def get_average_rank(self, total_rank: int, is_lap: bool | None) -> str:
+        return f"{total_rank/self.get_effective_score_count(is_lap):.08}"
+
+    def get_average_standard(self, total_standard: int, is_lap: bool | None) -> str:
+        return f"{total_standard/self.get_effective_score_count(is_lap):.08}"
+
+    def get_average_record_ratio(self, total_record_ratio: float, is_lap: bool | None) -> str:
+        return f"{total_record_ratio/self.get_effective_score_count(is_lap):.08}"
+
+
+# Scores
+
+class ScoreWithPlayerRowSerializer(RowSerializer):
+    fields = {
+        'id': RowField(),
+        'rank': RowField(convert=to_int),
+        'value': RowField(),
+        'player': PlayerBasicRowSerializer(),
+        'track': RowField(),
+        'category': RowField(convert=to_category),
+        'is_lap': RowField(),
+        'standard': RowField(convert=to_int),
+        'record_ratio': RowField(convert=to_float),
+        'date': RowField(convert=to_date),
+        'video_link': RowField(),
+        'ghost_link': RowField(),
+        'comment': RowField(),
+    }
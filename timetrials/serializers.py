@@ -5,8 +5,9 @@ from rest_framework import serializers
 from core.models import User
 from core.serializers import TimestampField
 
-from timetrials import models, queries
+from timetrials import models
 from timetrials.models.categories import CategoryChoices
+from timetrials.models.regions import get_region_player_counts
 from timetrials.models.scores import ScoreSubmissionStatus
 from timetrials.models.stats.region_stats import TopScoreCountChoices
 
@@ -77,8 +78,13 @@ TopScoreCountField = map_enum_field({
 class RegionSerializer(serializers.ModelSerializer):
     player_count = serializers.SerializerMethodField()
 
+    # Player counts of all regions, fetched once per serializer instance
+    player_counts = None
+
     def get_player_count(self, region: models.Region) -> int:
-        return queries.query_region_players(region).count()
+        if self.player_counts is None:
+            self.player_counts = get_region_player_counts()
+        return self.player_counts.get(region.pk, 0)
 
     class Meta:
         model = models.Region
@@ -95,13 +101,13 @@ class RegionStatsSerializer(serializers.ModelSerializer):
     average_record_ratio = serializers.SerializerMethodField()
 
     def get_average_rank(self, stats: models.RegionStats) -> str:
-        return f"{stats.total_rank/stats.effective_score_count:.08}"
+        return f"{stats.average_rank:.08}"
 
     def get_average_standard(self, stats: models.RegionStats) -> str:
-        return f"{stats.total_standard/stats.effective_score_count:.08}"
+        return f"{stats.average_standard:.08}"
 
     def get_average_record_ratio(self, stats: models.RegionStats) -> str:
-        return f"{stats.total_record_ratio/stats.effective_score_count:.08}"
+        return f"{stats.average_record_ratio:.08}"
 
     class Meta:
         model = models.RegionStats
@@ -333,6 +339,10 @@ class ScoreSubmissionSerializer(serializers.ModelSerializer):
         }
 
 
+class ScoreSubmissionAcceptSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
 class EditScoreSubmissionSerializer(serializers.ModelSerializer):
     score = ScoreBasicSerializer(read_only=True)
     score_id = serializers.PrimaryKeyRelatedField(
@@ -1,9 +1,23 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
-from timetrials.models.scores import EditScoreSubmission, ScoreSubmission, ScoreSubmissionStatus
-from timetrials.models.stats import PlayerStatsGroup
-from timetrials.tasks import generate_player_stats
+from timetrials.caching import (
+    PLAYERS_TAG, REGIONS_TAG, STANDARDS_TAG, invalidate_score, invalidate_tags
+)
+from timetrials.models.players import Player
+from timetrials.models.regions import (
+    Region, generate_region_closures, invalidate_region_descendants,
+    invalidate_region_player_counts, query_region_ancestor_ids
+)
+from timetrials.models.scores import (
+    EditScoreSubmission, PersonalBest, Score, ScoreSubmission, ScoreSubmissionStatus,
+    delete_personal_bests, update_personal_bests, update_player_regional_ranks
+)
+from timetrials.models.standards import Standard, StandardLevel, queue_standard_ranges
+from timetrials.models.stats import PlayerStatsGroup, RegionStatsGroup
+from timetrials.models.stats.player_stats import invalidate_active_player_stats_group
+from timetrials.models.tracks import Track, invalidate_track_ids
+from timetrials.tasks import generate_player_stats, generate_region_stats, generate_regional_ranks
 
 
 @receiver(pre_save, sender=ScoreSubmission)
@@ -18,7 +32,165 @@ def edit_score_submission_pre_save(sender, instance: EditScoreSubmission, **kwar
         instance.edit_score()
 
 
+@receiver(post_save, sender=Score)
+def score_post_save(sender, instance: Score, **kwargs):
+    # Also recalculate personal bests the score held before being moved to another player or track
+    keys = set(
+        PersonalBest.objects.filter(score=instance).values_list('player', 'track', 'is_lap')
+    )
+    keys.add((instance.player_id, instance.track_id, instance.is_lap))
+
+    for player_id, track_id, is_lap in keys:
+        update_personal_bests(player_id, track_id, is_lap)
+
+    invalidate_score(instance)
+
+
+@receiver(pre_delete, sender=Score)
+def score_pre_delete(sender, instance: Score, **kwargs):
+    # Personal bests would otherwise be deleted in cascade without moving up slower ones
+    delete_personal_bests(PersonalBest.objects.filter(score=instance))
+
+
+@receiver(post_delete, sender=Score)
+def score_post_delete(sender, instance: Score, **kwargs):
+    update_personal_bests(instance.player_id, instance.track_id, instance.is_lap)
+
+    invalidate_score(instance)
+
+
+@receiver(post_save, sender=Player)
+def player_post_save(sender, instance: Player, **kwargs):
+    update_player_regional_ranks(instance.pk)
+
+    invalidate_tags([PLAYERS_TAG])
+    invalidate_region_player_counts()
+
+
+@receiver(post_delete, sender=Player)
+def player_post_delete(sender, instance: Player, **kwargs):
+    invalidate_region_player_counts()
+
+
+def update_region_tree():
+    generate_region_closures()
+    invalidate_region_descendants()
+    invalidate_region_player_counts()
+    invalidate_tags([REGIONS_TAG])
+
+
+@receiver(pre_save, sender=Region)
+def region_pre_save(sender, instance: Region, **kwargs):
+    # Keep the fields affecting regional ranks to only rebuild those which changed
+    instance.previous_tree_fields = Region.objects.filter(
+        pk=instance.pk
+    ).values('parent', 'type', 'is_ranked').first()
+
+
+@receiver(post_save, sender=Region)
+def region_post_save(sender, instance: Region, created, **kwargs):
+    previous = getattr(instance, 'previous_tree_fields', None)
+
+    # New regions have no players yet, so only the closures need to be added
+    if created or previous is None:
+        update_region_tree()
+        return
+
+    parent_changed = previous['parent'] != instance.parent_id
+    ranking_changed = (
+        previous['type'] != instance.type or previous['is_ranked'] != instance.is_ranked
+    )
+
+    if not parent_changed and not ranking_changed:
+        return
+
+    update_region_tree()
+
+    region_ids = set()
+
+    # Players of the region only move between the ancestors the old and new parents don't share
+    if parent_changed:
+        region_ids.update(
+            query_region_ancestor_ids(previous['parent'])
+            ^ query_region_ancestor_ids(instance.parent_id)
+        )
+
+    if ranking_changed:
+        region_ids.add(instance.pk)
+
+    generate_regional_ranks.delay_on_commit(sorted(region_ids))
+
+
+@receiver(post_delete, sender=Region)
+def region_post_delete(sender, instance: Region, **kwargs):
+    update_region_tree()
+
+    # Players of the deleted region are no longer part of any of its ancestors
+    region_ids = query_region_ancestor_ids(instance.parent_id)
+    if region_ids:
+        generate_regional_ranks.delay_on_commit(sorted(region_ids))
+
+
+@receiver(post_save, sender=Track)
+@receiver(post_delete, sender=Track)
+def track_post_save_delete(sender, instance: Track, **kwargs):
+    invalidate_track_ids()
+
+
+@receiver(pre_save, sender=Standard)
+def standard_pre_save(sender, instance: Standard, raw=False, **kwargs):
+    # Ranges the standard was part of must also be rebuilt when it moves to another track or level
+    if not raw:
+        instance.previous_range_key = Standard.objects.filter(
+            pk=instance.pk
+        ).values_list('track', 'is_lap', 'level__is_legacy').first()
+
+
+@receiver(post_save, sender=Standard)
+@receiver(post_delete, sender=Standard)
+def standard_post_save_delete(sender, instance: Standard, raw=False, **kwargs):
+    # Fixtures are loaded one standard at a time, generate_standardranges rebuilds them at once
+    if raw:
+        return
+
+    keys = {(instance.track_id, instance.is_lap, instance.level.is_legacy)}
+    previous_key = getattr(instance, 'previous_range_key', None)
+    if previous_key is not None:
+        keys.add(previous_key)
+
+    queue_standard_ranges(keys)
+    invalidate_tags([STANDARDS_TAG])
+
+
+@receiver(post_save, sender=StandardLevel)
+@receiver(post_delete, sender=StandardLevel)
+def standard_level_post_save_delete(sender, instance: StandardLevel, raw=False, **kwargs):
+    if raw:
+        return
+
+    # Standards of a deleted level were deleted first and already queued their own ranges, while
+    # those of a saved level may have moved between legacy and current ranges
+    queue_standard_ranges(
+        (track_id, is_lap, is_legacy)
+        for track_id, is_lap in instance.standards.values_list('track', 'is_lap').distinct()
+        for is_legacy in (False, True)
+    )
+    invalidate_tags([STANDARDS_TAG])
+
+
 @receiver(post_save, sender=PlayerStatsGroup)
 def player_stats_group_post_save(sender, instance: PlayerStatsGroup, created, **kwargs):
     if created:
         generate_player_stats.delay_on_commit(instance.pk)
+
+
+@receiver(post_delete, sender=PlayerStatsGroup)
+def player_stats_group_post_delete(sender, instance: PlayerStatsGroup, **kwargs):
+    if instance.is_active:
+        invalidate_active_player_stats_group()
+
+
+@receiver(post_save, sender=RegionStatsGroup)
+def region_stats_group_post_save(sender, instance: RegionStatsGroup, created, **kwargs):
+    if created:
+        generate_region_stats.delay_on_commit(instance.pk)
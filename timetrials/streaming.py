@@ -0,0 +1,46 @@
+from django.http import StreamingHttpResponse
+
+from rest_framework.renderers import JSONRenderer
+
+from timetrials.row_serializers import RowSerializerMixin
+
+
+STREAM_CHUNK_SIZE = 2000
+
+
+class StreamingListMixin:
+    """
+    Stream JSON list responses row by row instead of serializing the whole list in memory first.
+    Rows are fetched from the database in chunks, so memory use no longer grows with the number of
+    rows. Other formats, such as the browsable API, are rendered as usual.
+    """
+
+    stream_chunk_size = STREAM_CHUNK_SIZE
+
+    def list(self, request, *args, **kwargs):
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+
+        # A single serializer is reused for every row so that it can share state between rows
+        if isinstance(self, RowSerializerMixin):
+            serializer = self.get_row_serializer()
+            queryset = serializer.values(queryset)
+        else:
+            serializer = self.get_serializer()
+
+        renderer = request.accepted_renderer
+
+        def stream():
+            yield b'['
+
+            for index, row in enumerate(queryset.iterator(chunk_size=self.stream_chunk_size)):
+                if index > 0:
+                    yield b','
+
+                yield renderer.render(serializer.to_representation(row))
+
+            yield b']'
+
+        return StreamingHttpResponse(stream(), content_type=renderer.media_type)
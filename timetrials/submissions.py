@@ -0,0 +1,150 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from timetrials import caching, models
+from timetrials.models.scores import lock_leaderboards, update_personal_bests
+from timetrials.tasks import generate_player_stats
+
+
+def annotate_submissions_base_rank(submissions: QuerySet):
+    """
+    Annotate each submission with the overall rank its score would have among the current personal
+    bests, the same way as `Score.overall_rank`.
+    """
+
+    personal_bests = models.PersonalBest.objects.filter(
+        track=OuterRef('track'),
+        is_lap=OuterRef('is_lap'),
+        category=OuterRef('category'),
+    )
+
+    return submissions.annotate(
+        base_rank=Coalesce(
+            # Rank of the fastest personal best which is not faster
+            Subquery(
+                personal_bests.filter(
+                    value__gte=OuterRef('value')
+                ).order_by('value').values('rank')[:1]
+            ),
+            # Slower than every personal best
+            Subquery(
+                personal_bests.order_by().values('track').annotate(
+                    count=Count('pk')
+                ).values('count')
+            ) + 1,
+            1,
+        )
+    )
+
+
+def find_initial_ranks(submissions: list[models.ScoreSubmission]) -> list[int]:
+    """
+    Find the initial rank of the score of each submission annotated with its base rank, as if the
+    submissions were accepted one after the other in the given order.
+    """
+
+    # Personal bests of the submitting players before any submission is accepted
+    best_values = {
+        (pb.player_id, pb.track_id, pb.is_lap, pb.category): pb.value
+        for pb in models.PersonalBest.objects.filter(
+            player__in={submission.player_id for submission in submissions},
+            track__in={submission.track_id for submission in submissions},
+        ).only('player', 'track', 'is_lap', 'category', 'value')
+    }
+
+    # Best value of each player among the submissions accepted so far, by leaderboard
+    accepted_values = defaultdict(dict)
+
+    initial_ranks = list()
+
+    for submission in submissions:
+        leaderboard = (submission.track_id, submission.is_lap, submission.category)
+
+        # Players only overtake this score once if not already faster before the batch
+        rank = submission.base_rank
+        for player_id, value in accepted_values[leaderboard].items():
+            best_value = best_values.get((player_id, *leaderboard))
+            if value < submission.value and (best_value is None or best_value >= submission.value):
+                rank += 1
+
+        initial_ranks.append(rank)
+
+        # A score counts in the leaderboards of its own category and every less restricted one
+        for category in models.CategoryChoices.values:
+            if category >= submission.category:
+                values = accepted_values[(submission.track_id, submission.is_lap, category)]
+                values[submission.player_id] = min(
+                    values.get(submission.player_id, submission.value), submission.value
+                )
+
+    return initial_ranks
+
+
+def accept_score_submissions(submissions: QuerySet,
+                             reviewed_by=None) -> list[models.ScoreSubmission]:
+    """
+    Accept every pending submission of the queryset in a single transaction, in submission order.
+    Scores are created at once and personal bests are updated once per player and track, without
+    going through the save signals of each submission. Player stats are regenerated once for the
+    whole batch.
+    """
+
+    with transaction.atomic():
+        pending_ids = list(submissions.filter(
+            status=models.ScoreSubmissionStatus.PENDING,
+            score__isnull=True,
+        ).select_for_update().values_list('pk', flat=True))
+
+        # Initial ranks are found from personal bests which can't change until the batch is accepted
+        lock_leaderboards(models.ScoreSubmission.objects.filter(pk__in=pending_ids).values('track'))
+
+        pending_submissions = list(annotate_submissions_base_rank(
+            models.ScoreSubmission.objects.filter(pk__in=pending_ids)
+        ).order_by('submitted_at', 'pk'))
+
+        if not pending_submissions:
+            return []
+
+        initial_ranks = find_initial_ranks(pending_submissions)
+
+        scores = models.Score.objects.bulk_create([
+            models.Score(
+                value=submission.value,
+                category=submission.category,
+                is_lap=submission.is_lap,
+                player_id=submission.player_id,
+                track_id=submission.track_id,
+                date=submission.date,
+                video_link=submission.video_link,
+                ghost_link=submission.ghost_link,
+                comment=submission.comment,
+                initial_rank=initial_rank,
+            )
+            for submission, initial_rank in zip(pending_submissions, initial_ranks)
+        ])
+
+        reviewed_at = timezone.now()
+        for submission, score in zip(pending_submissions, scores):
+            submission.score = score
+            submission.status = models.ScoreSubmissionStatus.ACCEPTED
+            submission.reviewed_by = reviewed_by
+            submission.reviewed_at = reviewed_at
+
+        models.ScoreSubmission.objects.bulk_update(
+            pending_submissions, ['score', 'status', 'reviewed_by', 'reviewed_at']
+        )
+
+        for player_id, track_id, is_lap in dict.fromkeys(
+            (score.player_id, score.track_id, score.is_lap) for score in scores
+        ):
+            update_personal_bests(player_id, track_id, is_lap)
+
+        caching.invalidate_scores(scores)
+
+        generate_player_stats.delay_on_commit(incremental=True)
+
+    return pending_submissions
@@ -1,13 +1,59 @@
 from celery import shared_task
 
-from timetrials.models.stats import player_stats
+from timetrials import caching
+from timetrials.models import scores
+from timetrials.models.stats import player_stats, region_stats
 
 
 @shared_task
-def generate_player_stats(group_id=None):
+def generate_player_stats(group_id=None, incremental=False):
     if group_id is None:
         # This will automatically queue this task again with the ID of the created group
-        group = player_stats.PlayerStatsGroup.objects.create()
+        group = player_stats.PlayerStatsGroup.objects.create(is_incremental=incremental)
     else:
         group = player_stats.PlayerStatsGroup.objects.get(pk=group_id)
-        player_stats.generate_all_player_stats(group=group)
+        if group.is_incremental:
+            player_stats.generate_incremental_player_stats(group=group)
+        else:
+            player_stats.generate_all_player_stats(group=group)
+        delete_old_player_stats_groups.delay()
+
+
+@shared_task
+def delete_old_player_stats_groups():
+    player_stats.delete_old_player_stats_groups()
+
+
+@shared_task
+def generate_region_stats(group_id=None):
+    if group_id is None:
+        # This will automatically queue this task again with the ID of the created group
+        region_stats.RegionStatsGroup.objects.create()
+    else:
+        group = region_stats.RegionStatsGroup.objects.get(pk=group_id)
+        region_stats.generate_all_region_stats_sql(group=group)
+        delete_old_region_stats_groups.delay()
+
+
+@shared_task
+def delete_old_region_stats_groups():
+    region_stats.delete_old_region_stats_groups()
+
+
+@shared_task
+def generate_personal_bests():
+    scores.generate_all_personal_bests()
+    # Regional ranks shown in cached responses may have changed
+    caching.invalidate_tags([caching.REGIONS_TAG])
+
+
+@shared_task
+def generate_regional_ranks(region_ids):
+    scores.generate_regional_ranks(region_ids)
+    # Regional ranks shown in cached responses may have changed
+    caching.invalidate_tags([caching.REGIONS_TAG])
+
+
+@shared_task
+def refresh_cached_response(path, lock_token):
+    caching.refresh_cached_response(path, lock_token)
@@ -0,0 +1,593 @@
+import datetime
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+
+from django.db import connection
+from django.db.models import F, Value
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.renderers import JSONRenderer
+
+from timetrials import caching, models, row_serializers, serializers
+from timetrials.models import standards
+from timetrials.models.scores import generate_all_personal_bests, generate_regional_ranks
+from timetrials.models.stats.player_stats import invalidate_active_player_stats_group
+from timetrials.models.stats.region_stats import (
+    delete_old_region_stats_groups, generate_all_region_stats, generate_all_region_stats_sql
+)
+from timetrials.models.tracks import invalidate_track_ids
+from timetrials.queries import annotate_scores_record_ratio, annotate_scores_standard
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PlayerScoreListViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        world = models.Region.objects.create(
+            type=models.RegionTypeChoices.WORLD, name="World", code="WORLD", is_ranked=True
+        )
+        cls.country = models.Region.objects.create(
+            type=models.RegionTypeChoices.COUNTRY, name="Country", code="CO", parent=world,
+            is_ranked=True,
+        )
+
+        cup = models.TrackCup.objects.create(name="Cup", code="cup")
+        cls.tracks = [
+            models.Track.objects.create(name=f"Track {index}", abbr=f"T{index}", cup=cup)
+            for index in range(2)
+        ]
+
+        cls.player = models.Player.objects.create(name="Player", region=cls.country)
+        cls.rival = models.Player.objects.create(name="Rival", region=cls.country)
+        other = models.Player.objects.create(name="Other")
+
+        # The player's personal bests differ by category, so that each category has its own ranks
+        for track in cls.tracks:
+            for is_lap in (False, True):
+                for player, category, value in (
+                    (cls.player, models.CategoryChoices.NON_SHORTCUT, 5000),
+                    (cls.player, models.CategoryChoices.UNRESTRICTED, 4000),
+                    (cls.rival, models.CategoryChoices.NON_SHORTCUT, 4500),
+                    (other, models.CategoryChoices.UNRESTRICTED, 4200),
+                ):
+                    models.Score.objects.create(
+                        player=player, track=track, is_lap=is_lap, category=category, value=value
+                    )
+
+    def get_ranks(self, player, **params):
+        response = self.client.get(
+            reverse('timetrials:player-score-list', args=[player.pk]), params
+        )
+        self.assertEqual(response.status_code, 200)
+        return [(score['track'], score['is_lap'], score['rank']) for score in response.json()]
+
+    def assertRanks(self, ranks, expected_rank, is_lap):
+        self.assertEqual(ranks, [(track.pk, is_lap, expected_rank) for track in self.tracks])
+
+    def test_lap_mode_ranks(self):
+        for player, category, region, expected_rank in (
+            (self.player, 'nonsc', None, 2),
+            (self.player, 'unres', None, 1),
+            (self.player, 'nonsc', self.country, 2),
+            (self.player, 'unres', self.country, 1),
+            (self.rival, 'nonsc', None, 1),
+            (self.rival, 'unres', None, 3),
+            (self.rival, 'nonsc', self.country, 1),
+            (self.rival, 'unres', self.country, 2),
+        ):
+            for lap_mode, is_lap in (('course', False), ('lap', True)):
+                params = dict(category=category, lap_mode=lap_mode)
+                if region is not None:
+                    params['region'] = region.pk
+
+                with self.subTest(player=player.name, **params):
+                    self.assertRanks(self.get_ranks(player, **params), expected_rank, is_lap)
+
+    def test_both_lap_modes_ranks(self):
+        ranks = self.get_ranks(self.rival, category='unres', region=self.country.pk)
+        self.assertEqual(ranks, [
+            (track.pk, is_lap, 2) for track in self.tracks for is_lap in (False, True)
+        ])
+
+    def test_stale_response_refreshed_in_background(self):
+        params = dict(category='nonsc', lap_mode='course')
+        self.assertRanks(self.get_ranks(self.player, **params), 2, False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other = models.Player.objects.get(name="Other")
+            for track in self.tracks:
+                models.Score.objects.create(player=other, track=track, value=3000)
+
+        with mock.patch('timetrials.tasks.refresh_cached_response') as task:
+            # Every request gets the stale response, and the refresh is only queued once
+            for _ in range(2):
+                self.assertRanks(self.get_ranks(self.player, **params), 2, False)
+            task.delay.assert_called_once()
+
+        caching.refresh_cached_response(*task.delay.call_args.args)
+        self.assertRanks(self.get_ranks(self.player, **params), 3, False)
+
+    def test_standard_changes_invalidate_cache(self):
+        params = dict(category='nonsc', lap_mode='course')
+        url = reverse('timetrials:player-score-list', args=[self.player.pk])
+        self.assertEqual([score['standard'] for score in self.client.get(url, params).json()], [
+            None for _ in self.tracks
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            level = models.StandardLevel.objects.create(
+                name="Level", code="L", value=7, is_legacy=True
+            )
+            for track in self.tracks:
+                models.Standard.objects.create(
+                    level=level, track=track, category=models.CategoryChoices.NON_SHORTCUT
+                )
+
+        with mock.patch('timetrials.tasks.refresh_cached_response') as task:
+            self.client.get(url, params)
+        caching.refresh_cached_response(*task.delay.call_args.args)
+
+        self.assertEqual([score['standard'] for score in self.client.get(url, params).json()], [
+            level.pk for _ in self.tracks
+        ])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RegionRegionalRanksTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        world = models.Region.objects.create(
+            type=models.RegionTypeChoices.WORLD, name="World", code="WORLD", is_ranked=True
+        )
+        cls.countries = [
+            models.Region.objects.create(
+                type=models.RegionTypeChoices.COUNTRY, name=f"Country {index}", code=f"C{index}",
+                parent=world, is_ranked=True,
+            )
+            for index in range(2)
+        ]
+        cls.subnational = models.Region.objects.create(
+            type=models.RegionTypeChoices.SUBNATIONAL, name="Subnational", code="SUB",
+            parent=cls.countries[0], is_ranked=True,
+        )
+
+        cup = models.TrackCup.objects.create(name="Cup", code="cup")
+        track = models.Track.objects.create(name="Track", abbr="T", cup=cup)
+
+        for region, value in ((cls.subnational, 5000), (cls.countries[0], 4000),
+                              (cls.countries[1], 4500)):
+            player = models.Player.objects.create(name=f"Player {value}", region=region)
+            models.Score.objects.create(player=player, track=track, value=value)
+
+    def query_regional_ranks(self):
+        return sorted(models.RegionalRank.objects.values_list(
+            'personal_best__player', 'region', 'track', 'is_lap', 'category', 'value', 'rank'
+        ))
+
+    def save_region(self, region):
+        with mock.patch('timetrials.signals.generate_regional_ranks') as task:
+            region.save()
+        return task.delay_on_commit.call_args
+
+    def test_rename_does_not_rebuild(self):
+        self.subnational.name = "Renamed"
+        self.assertIsNone(self.save_region(self.subnational))
+
+    def test_move_rebuilds_old_and_new_parents(self):
+        self.subnational.parent = self.countries[1]
+        call_args = self.save_region(self.subnational)
+        self.assertEqual(call_args.args, ([self.countries[0].pk, self.countries[1].pk],))
+
+        generate_regional_ranks(*call_args.args)
+        regional_ranks = self.query_regional_ranks()
+        generate_all_personal_bests()
+        self.assertEqual(regional_ranks, self.query_regional_ranks())
+
+    def test_unranking_rebuilds_region(self):
+        self.subnational.is_ranked = False
+        call_args = self.save_region(self.subnational)
+        self.assertEqual(call_args.args, ([self.subnational.pk],))
+
+        generate_regional_ranks(*call_args.args)
+        self.assertFalse(models.RegionalRank.objects.filter(region=self.subnational).exists())
+        regional_ranks = self.query_regional_ranks()
+        generate_all_personal_bests()
+        self.assertEqual(regional_ranks, self.query_regional_ranks())
+
+
+class DeleteOldRegionStatsGroupsTests(TestCase):
+
+    def test_incomplete_groups_are_deleted(self):
+        now = timezone.now()
+        old_incomplete, old_completed, latest, pending = [
+            models.RegionStatsGroup.objects.create(
+                created_at=now + datetime.timedelta(minutes=minutes), completed=completed
+            )
+            for minutes, completed in ((0, False), (1, True), (2, True), (3, False))
+        ]
+
+        delete_old_region_stats_groups()
+
+        self.assertQuerySetEqual(
+            models.RegionStatsGroup.objects.order_by('created_at'), [latest, pending]
+        )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StandardRangesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cup = models.TrackCup.objects.create(name="Cup", code="cup")
+        tracks = [
+            models.Track.objects.create(name=f"Track {index}", abbr=f"T{index}", cup=cup)
+            for index in range(2)
+        ]
+
+        cls.levels = [
+            models.StandardLevel.objects.create(
+                name=f"Level {index}", code=f"L{index}", value=index, is_legacy=is_legacy
+            )
+            for index, is_legacy in enumerate((True, True, False))
+        ]
+
+        for track in tracks:
+            for is_lap in (False, True):
+                for level, category, value in (
+                    (cls.levels[0], models.CategoryChoices.NON_SHORTCUT, 4000),
+                    (cls.levels[0], models.CategoryChoices.UNRESTRICTED, 3000),
+                    (cls.levels[1], models.CategoryChoices.NON_SHORTCUT, None),
+                    (cls.levels[2], models.CategoryChoices.NON_SHORTCUT, 5000),
+                ):
+                    models.Standard.objects.create(
+                        level=level, track=track, is_lap=is_lap, category=category, value=value
+                    )
+
+        standards.generate_standard_ranges()
+
+    def query_standard_ranges(self):
+        return sorted(models.StandardRange.objects.values_list(
+            'track', 'is_lap', 'category', 'is_legacy', 'level', 'values'
+        ), key=str)
+
+    def assertRangesRebuilt(self):
+        standard_ranges = self.query_standard_ranges()
+        standards.generate_standard_ranges()
+        self.assertEqual(standard_ranges, self.query_standard_ranges())
+
+    def test_standard_edit(self):
+        standard = models.Standard.objects.filter(value=4000).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            standard.value = 3500
+            standard.save()
+
+        self.assertTrue(models.StandardRange.objects.filter(
+            track=standard.track, is_lap=standard.is_lap, values__contains=3500,
+            level=standard.level,
+        ).exists())
+        self.assertRangesRebuilt()
+
+    def test_level_delete_rebuilds_once(self):
+        with mock.patch.object(
+            standards, 'generate_standard_ranges', wraps=standards.generate_standard_ranges
+        ) as generate_standard_ranges:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.levels[0].delete()
+
+        generate_standard_ranges.assert_called_once()
+        self.assertTrue(models.StandardRange.objects.filter(level=self.levels[1]).exists())
+        self.assertRangesRebuilt()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RegionStatsEnginesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        world = models.Region.objects.create(
+            type=models.RegionTypeChoices.WORLD, name="World", code="WORLD", is_ranked=True
+        )
+        countries = [
+            models.Region.objects.create(
+                type=models.RegionTypeChoices.COUNTRY, name=f"Country {index}", code=f"C{index}",
+                parent=world, is_ranked=True,
+            )
+            for index in range(2)
+        ]
+        subnational = models.Region.objects.create(
+            type=models.RegionTypeChoices.SUBNATIONAL, name="Subnational", code="SUB",
+            parent=countries[0], is_ranked=True,
+        )
+
+        cup = models.TrackCup.objects.create(name="Cup", code="cup")
+        tracks = [
+            models.Track.objects.create(name=f"Track {index}", abbr=f"T{index}", cup=cup)
+            for index in range(2)
+        ]
+
+        levels = [
+            models.StandardLevel.objects.create(
+                name=f"Level {index}", code=f"L{index}", value=index + 1, is_legacy=True
+            )
+            for index in range(2)
+        ]
+
+        players = [
+            models.Player.objects.create(name=f"Player {index}", region=region)
+            for index, region in enumerate((subnational, countries[0], countries[1], None))
+        ]
+
+        for track in tracks:
+            for is_lap in (False, True):
+                models.Standard.objects.create(
+                    level=levels[0], track=track, is_lap=is_lap, value=4500
+                )
+                models.Standard.objects.create(level=levels[1], track=track, is_lap=is_lap)
+
+                for player, category, value in (
+                    (players[0], models.CategoryChoices.NON_SHORTCUT, 5000),
+                    (players[0], models.CategoryChoices.UNRESTRICTED, 3900),
+                    (players[1], models.CategoryChoices.NON_SHORTCUT, 4400),
+                    (players[2], models.CategoryChoices.SHORTCUT, 4700 + track.pk % 2 * 500),
+                    (players[3], models.CategoryChoices.NON_SHORTCUT, 4200),
+                ):
+                    models.Score.objects.create(
+                        player=player, track=track, is_lap=is_lap, category=category, value=value
+                    )
+
+    def setUp(self):
+        # Tracks of other tests may still be cached in process
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_track_ids()
+
+    def query_region_stats(self, group):
+        return {
+            (stats['region'], stats['top_score_count'], stats['category'], stats['is_lap']): stats
+            for stats in models.RegionStats.objects.filter(group=group).values(
+                'region', 'top_score_count', 'category', 'is_lap', 'participation_count',
+                'score_count', 'total_score', 'total_rank', 'total_standard',
+                'total_record_ratio', 'total_records', 'average_rank', 'average_standard',
+                'average_record_ratio', 'rank',
+            )
+        }
+
+    def test_engines_match(self):
+        groups = models.RegionStatsGroup.objects.bulk_create([
+            models.RegionStatsGroup(), models.RegionStatsGroup()
+        ])
+        generate_all_region_stats(groups[0])
+        generate_all_region_stats_sql(groups[1])
+
+        python_stats = self.query_region_stats(groups[0])
+        sql_stats = self.query_region_stats(groups[1])
+
+        self.assertTrue(python_stats)
+        self.assertEqual(python_stats.keys(), sql_stats.keys())
+
+        for key, stats in python_stats.items():
+            with self.subTest(key=key):
+                for field, value in stats.items():
+                    if isinstance(value, float):
+                        self.assertAlmostEqual(value, sql_stats[key][field], places=9)
+                    else:
+                        self.assertEqual(value, sql_stats[key][field], field)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ScoreIndexesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cup = models.TrackCup.objects.create(name="Cup", code="cup")
+        track = models.Track.objects.create(name="Track", abbr="T", cup=cup)
+        player = models.Player.objects.create(name="Player")
+
+        for value in range(4000, 4010):
+            models.Score.objects.create(player=player, track=track, value=value, initial_rank=1)
+
+    def assertNoScoreSeqScan(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+
+        score_queries = [
+            query['sql'] for query in queries.captured_queries
+            if models.Score._meta.db_table in query['sql']
+        ]
+        self.assertTrue(score_queries)
+
+        with connection.cursor() as cursor:
+            # Tables of the test database are too small for the planner to prefer any index, so
+            # sequential scans are only planned where no index can be used
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            for sql in score_queries:
+                cursor.execute('EXPLAIN ' + sql)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                self.assertNotIn(f'Seq Scan on {models.Score._meta.db_table}', plan, sql)
+
+    def test_records(self):
+        self.assertNoScoreSeqScan(reverse('timetrials:record-list'), dict(category='nonsc'))
+
+    def test_latest_scores(self):
+        self.assertNoScoreSeqScan(reverse('timetrials:latest-score-list'), dict(limit=10))
+
+    def test_latest_records(self):
+        self.assertNoScoreSeqScan(reverse('timetrials:latest-record-list'), dict(limit=10))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PlayerStatsListViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.world = models.Region.objects.create(
+            type=models.RegionTypeChoices.WORLD, name="World", code="WORLD", is_ranked=True
+        )
+
+        cup = models.TrackCup.objects.create(name="Cup", code="cup")
+        for index in range(2):
+            models.Track.objects.create(name=f"Track {index}", abbr=f"T{index}", cup=cup)
+
+        group = models.PlayerStatsGroup.objects.create(completed=True, is_active=True)
+
+        for index in range(10):
+            player = models.Player.objects.create(name=f"Player {index}", region=cls.world)
+            if index % 2:
+                get_user_model().objects.create(
+                    username=f"user{index}", email=f"user{index}@example.com", player=player
+                )
+
+            models.PlayerStats.objects.create(
+                group=group, player=player, region=cls.world, is_lap=None, score_count=4,
+                total_score=16000 + index, total_rank=4 + index, total_standard=4,
+                total_record_ratio=4.0, total_records=0, leaderboard_points=0,
+                total_score_rank=index + 1,
+            )
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_track_ids()
+            invalidate_active_player_stats_group()
+
+    def get_rankings(self, limit):
+        response = self.client.get(reverse('timetrials:player-stats-list'), dict(
+            category='nonsc', lap_mode='overall', region=self.world.pk, metric='total_score',
+            limit=limit,
+        ))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        # Fill the caches of the active group and the track ids
+        self.get_rankings(1)
+
+        for limit in (2, 10):
+            with self.subTest(limit=limit), self.assertNumQueries(3):
+                self.assertEqual(len(self.get_rankings(limit)), limit)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RowSerializerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        world = models.Region.objects.create(
+            type=models.RegionTypeChoices.WORLD, name="World", code="WORLD", is_ranked=True
+        )
+        country = models.Region.objects.create(
+            type=models.RegionTypeChoices.COUNTRY, name="Country", code="CO", parent=world,
+            is_ranked=True,
+        )
+
+        cup = models.TrackCup.objects.create(name="Cup", code="cup")
+        tracks = [
+            models.Track.objects.create(name=f"Track {index}", abbr=f"T{index}", cup=cup)
+            for index in range(2)
+        ]
+
+        # Scores of the second track have no standard
+        level = models.StandardLevel.objects.create(name="Level", code="L", value=1, is_legacy=True)
+        for is_lap in (False, True):
+            models.Standard.objects.create(level=level, track=tracks[0], is_lap=is_lap)
+        standards.generate_standard_ranges()
+
+        players = [
+            models.Player.objects.create(name="Player", region=country, alias="Alias"),
+            models.Player.objects.create(name="Rival", region=world),
+            models.Player.objects.create(name="Other"),
+        ]
+        get_user_model().objects.create(
+            username="user", email="user@example.com", player=players[0]
+        )
+
+        for track in tracks:
+            for is_lap in (False, True):
+                for player, category, value in (
+                    (players[0], models.CategoryChoices.NON_SHORTCUT, 5000),
+                    (players[1], models.CategoryChoices.SHORTCUT, 4500),
+                    (players[2], models.CategoryChoices.NON_SHORTCUT, 4700),
+                ):
+                    models.Score.objects.create(
+                        player=player, track=track, is_lap=is_lap, category=category, value=value,
+                        date=datetime.date(2020, 1, 1 + players.index(player)),
+                        video_link="https://example.com" if player == players[0] else None,
+                    )
+
+        generate_all_personal_bests()
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_track_ids()
+
+    def assertSameRepresentation(self, queryset, serializer_class, row_serializer_class):
+        self.assertTrue(queryset)
+        self.assertEqual(
+            JSONRenderer().render(row_serializer_class().serialize(queryset)),
+            JSONRenderer().render(serializer_class(queryset, many=True).data),
+        )
+
+    def test_scores_with_player(self):
+        category = models.CategoryChoices.SHORTCUT
+        scores = annotate_scores_record_ratio(
+            annotate_scores_standard(
+                models.Score.objects.select_related('player__user').annotate(
+                    rank=Value(1),
+                ).order_by('pk'),
+                category,
+                legacy=True,
+            ),
+            category,
+        )
+
+        self.assertTrue(scores.filter(standard__isnull=True).exists())
+        self.assertSameRepresentation(
+            scores, serializers.ScoreWithPlayerSerializer,
+            row_serializers.ScoreWithPlayerRowSerializer,
+        )
+
+    def test_player_stats(self):
+        group = models.PlayerStatsGroup.objects.create()
+        world = models.Region.objects.get(type=models.RegionTypeChoices.WORLD)
+
+        for index, player in enumerate(models.Player.objects.order_by('pk')):
+            for is_lap, lap_count in ((False, 1), (True, 1), (None, 2)):
+                models.PlayerStats.objects.create(
+                    group=group, player=player, region=world, is_lap=is_lap,
+                    score_count=2 * lap_count, total_score=9400 * lap_count + index,
+                    total_rank=(index + 1) * 2 * lap_count, total_standard=3 * lap_count,
+                    total_record_ratio=1.9573 * lap_count / (index + 1),
+                    total_records=int(index == 0) * 2 * lap_count, leaderboard_points=7 - index,
+                    total_score_rank=index + 1,
+                )
+
+        stats = models.PlayerStats.objects.filter(group=group).select_related(
+            'player__user'
+        ).annotate(
+            rank=F('total_score_rank')
+        ).order_by('pk')
+
+        self.assertTrue(stats.filter(is_lap__isnull=True).exists())
+        self.assertSameRepresentation(
+            stats, serializers.PlayerStatsSerializer, row_serializers.PlayerStatsRowSerializer
+        )
+
+    def test_region_stats(self):
+        group, = models.RegionStatsGroup.objects.bulk_create([models.RegionStatsGroup()])
+        generate_all_region_stats_sql(group)
+
+        stats = models.RegionStats.objects.filter(
+            group=group, rank__isnull=False
+        ).select_related(
+            'region'
+        ).order_by('pk')
+
+        self.assertTrue(stats.filter(is_lap__isnull=True).exists())
+        self.assertSameRepresentation(
+            stats, serializers.RegionStatsSerializer, row_serializers.RegionStatsRowSerializer
+        )
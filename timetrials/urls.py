@@ -28,6 +28,8 @@ urlpatterns = [
          name='submission-create'),
     path('submissions/delete/<int:pk>', views.ScoreSubmissionDestroyView.as_view(),
          name='submission-delete'),
+    path('submissions/accept/', views.ScoreSubmissionAcceptView.as_view(),
+         name='submission-accept'),
     path('submissions/edits/', views.EditScoreSubmissionListView.as_view(),
          name='edit-submission-list'),
     path('submissions/edits/create/', views.EditScoreSubmissionCreateView.as_view(),
@@ -0,0 +1,62 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Interval in seconds between checks of whether the value changed in another process
+VERSIONED_CACHE_CHECK_INTERVAL = 10
+
+
+class VersionedCache:
+    """
+    Keep a value computed from the database in the memory of each process, shared with other
+    processes through the cache backend. The value is only recomputed once invalidated, and each
+    process checks whether it changed elsewhere at most once per check interval.
+    """
+
+    def __init__(self, name: str, query, check_interval=VERSIONED_CACHE_CHECK_INTERVAL):
+        self.key = f'versioned:{name}'
+        self.version_key = f'versioned:{name}:version'
+        self.query = query
+        self.check_interval = check_interval
+
+        self.version = None
+        self.value = None
+        self.checked_at = 0.0
+
+    def get(self):
+        """Get the value from memory, refreshing it if it changed in another process."""
+
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return self.value
+
+        version = cache.get(self.version_key)
+
+        if version is None or version != self.version:
+            cached = cache.get(self.key)
+
+            if version is None or cached is None or cached['version'] != version:
+                version = time.time_ns()
+                cached = {'version': version, 'value': self.query()}
+                cache.set_many({
+                    self.key: cached,
+                    self.version_key: version,
+                }, timeout=None)
+
+            self.version = version
+            self.value = cached['value']
+
+        self.checked_at = now
+
+        return self.value
+
+    def invalidate(self):
+        """Invalidate the value in every process once the current transaction is committed."""
+
+        def invalidate():
+            cache.delete_many([self.key, self.version_key])
+            self.checked_at = 0.0
+
+        transaction.on_commit(invalidate)
@@ -17,6 +17,7 @@ from timetrials.views.views_submissions import (
     PlayerSubmitterDestroyView,
     PlayerSubmitteeListView,
     PlayerSubmitterListView,
+    ScoreSubmissionAcceptView,
     ScoreSubmissionCreateView,
     ScoreSubmissionDestroyView,
     ScoreSubmissionListView,
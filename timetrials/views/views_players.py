@@ -1,5 +1,4 @@
-from django.db.models import Value, Window
-from django.db.models.functions import Rank
+from django.db.models import F, Value
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext_lazy as _
 
@@ -8,13 +7,15 @@ from rest_framework.exceptions import ValidationError
 
 from knox.auth import TokenAuthentication
 
-from timetrials import filters, models, serializers
+from timetrials import filters, models, row_serializers, serializers, streaming
+from timetrials.models.stats.player_stats import get_active_player_stats_group_id
 
 
 @filters.extend_schema_with_filters
-class PlayerListView(filters.FilterMixin, generics.ListAPIView):
+class PlayerListView(streaming.StreamingListMixin, filters.FilterMixin, generics.ListAPIView):
     serializer_class = serializers.PlayerBasicSerializer
     filter_fields = (
+        filters.CursorFilter(fields={'name': str, 'id': int}),
         filters.OffsetFilter(),
         filters.LimitFilter(),
     )
@@ -41,27 +42,32 @@ class PlayerUpdateView(generics.UpdateAPIView):
 
 
 @filters.extend_schema_with_filters
-class PlayerStatsListView(filters.FilterMixin, generics.ListAPIView):
+class PlayerStatsListView(streaming.StreamingListMixin, row_serializers.RowSerializerMixin,
+                          filters.FilterMixin, generics.ListAPIView):
     serializer_class = serializers.PlayerStatsSerializer
+    row_serializer_class = row_serializers.PlayerStatsRowSerializer
     filter_fields = (
         filters.CategoryFilter(expand=False),
         filters.LapModeFilter(allow_overall=True),
         filters.RegionFilter(expand=False, ranked_only=True),
         filters.MetricOrderingFilter(),
+        filters.CursorFilter(fields={'rank': int, 'player_id': int}),
         filters.OffsetFilter(),
         filters.LimitFilter(),
     )
 
     def get_queryset(self):
-        score_count = models.Track.objects.count()
-        if self.get_filter_value(filters.LapModeFilter) is None:
-            score_count = score_count * 2
+        rank_field = self.get_filter_value(filters.MetricOrderingFilter)
 
         return self.limit(
-            self.filter(models.PlayerStats.objects.all()).filter(
-                score_count=score_count
+            self.filter(models.PlayerStats.objects.filter(
+                group=get_active_player_stats_group_id()
+            )).filter(
+                **{f'{rank_field}__isnull': False}
+            ).select_related(
+                'player__user'
             ).annotate(
-                rank=Window(Rank(), order_by=self.get_filter_value(filters.MetricOrderingFilter))
+                rank=F(rank_field)
             )
         )
 
@@ -76,11 +82,10 @@ class PlayerStatsRetrieveView(filters.FilterMixin, generics.RetrieveAPIView):
     )
 
     def get_queryset(self):
-        group = models.PlayerStatsGroup.objects.filter(
-            completed=True
-        ).order_by('-created_at').first()
         # Temporarily hardcode rank to 1
-        return self.filter(models.PlayerStats.objects.filter(group=group)).annotate(rank=Value(1))
+        return self.filter(models.PlayerStats.objects.filter(
+            group=get_active_player_stats_group_id()
+        )).annotate(rank=Value(1))
 
     def get_object(self):
         return get_object_or_404(self.get_queryset(), player=self.kwargs['pk'])
@@ -1,9 +1,6 @@
-from django.db.models import F, FloatField, Value, Window
-from django.db.models.functions import Cast, Rank
-
 from rest_framework import generics
 
-from timetrials import filters, models, serializers
+from timetrials import filters, models, row_serializers, serializers
 
 
 class RegionListView(generics.ListAPIView):
@@ -12,8 +9,10 @@ class RegionListView(generics.ListAPIView):
 
 
 @filters.extend_schema_with_filters
-class RegionStatsListView(filters.FilterMixin, generics.ListAPIView):
+class RegionStatsListView(row_serializers.RowSerializerMixin, filters.FilterMixin,
+                          generics.ListAPIView):
     serializer_class = serializers.RegionStatsSerializer
+    row_serializer_class = row_serializers.RegionStatsRowSerializer
     filter_fields = (
         filters.CategoryFilter(expand=False),
         filters.LapModeFilter(allow_overall=True),
@@ -22,17 +21,12 @@ class RegionStatsListView(filters.FilterMixin, generics.ListAPIView):
     )
 
     def get_queryset(self):
-        max_score_count = models.Track.objects.count()
-        if self.get_filter_value(filters.LapModeFilter) is None:
-            max_score_count *= 2
-
-        top_score_count = self.get_filter_value(filters.RegionStatsTopScoreCountFilter)
-
-        score_count = F('score_count') if top_score_count == 0 else Value(max_score_count)
-
-        return self.filter(models.RegionStats.objects.all()).filter(
-            score_count__gt=0
-        ).annotate(
-            average_rank=Cast(F('total_rank'), output_field=FloatField()) / score_count,
-            rank=Window(Rank(), order_by='average_rank')
-        )
+        group = models.RegionStatsGroup.objects.filter(
+            completed=True
+        ).order_by('-created_at').first()
+
+        return self.filter(models.RegionStats.objects.filter(group=group)).filter(
+            rank__isnull=False
+        ).select_related(
+            'region'
+        ).order_by('rank')
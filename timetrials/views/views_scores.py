@@ -1,19 +1,22 @@
-from django.db.models import OuterRef, Subquery, Value, Window
-from django.db.models.functions import NullIf, Rank
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+import datetime
+
+from django.db.models import Subquery, Value, Window
+from django.db.models.functions import Rank
+from django.db.models.sql.constants import LOUTER
+
+from django_cte import With
 
 from rest_framework import generics
 
-from timetrials import filters, models, serializers
+from timetrials import caching, filters, models, row_serializers, serializers
 from timetrials.queries import (
-    annotate_scores_record_ratio, annotate_scores_standard, query_region_players
+    annotate_scores_record_ratio, annotate_scores_standard, query_personal_bests,
+    query_player_ranked_scores, query_track_ranked_scores
 )
 
 
-@method_decorator(cache_page(60), name='list')
 @filters.extend_schema_with_filters
-class PlayerScoreListView(filters.FilterMixin, generics.ListAPIView):
+class PlayerScoreListView(caching.TaggedCacheMixin, filters.FilterMixin, generics.ListAPIView):
     serializer_class = serializers.ScoreSerializer
     filter_fields = (
         filters.CategoryFilter(),
@@ -22,50 +25,67 @@ class PlayerScoreListView(filters.FilterMixin, generics.ListAPIView):
         filters.RegionFilter(ranked_only=False, required=False, auto=False),
     )
 
-    def get_queryset(self):
-        # Get the player's lowest score on each track for both course and lap
-        player_scores = self.filter(models.Score.objects).filter(
-            player=self.kwargs['pk'],
-        ).order_by(
-            'track', 'is_lap', 'value'
-        ).distinct(
-            'track', 'is_lap'
-        )
+    def get_cache_tags(self):
+        return [
+            caching.PLAYERS_TAG,
+            caching.player_scores_tag(
+                self.get_filter_value(filters.CategoryFilter),
+                caching.region_tag_id(self.get_filter_value(filters.RegionFilter)),
+            ),
+        ]
 
+    def get_queryset(self):
         category = self.get_filter_value(filters.CategoryFilter)
 
-        # For each of the player's scores, query the lowest score from every player
-        # on that same track and category
-        track_scores = models.Score.objects.filter(
-            track=OuterRef(OuterRef('track')),
-            category__lte=category,
-            is_lap=OuterRef(OuterRef('is_lap')),
-        ).order_by('player', 'value').distinct('player')
+        # Get the player's lowest score on each track for both course and lap
+        player_filters = dict(player=self.kwargs['pk'])
+        is_lap = self.get_filter_value(filters.LapModeFilter)
+        if is_lap is not None:
+            player_filters['is_lap'] = is_lap
 
+        date = self.get_filter_value(filters.DateFilter)
         region = self.get_filter_value(filters.RegionFilter)
-        if region and region.type != models.RegionTypeChoices.WORLD:
-            track_scores = track_scores.filter(
-                player__in=Subquery(query_region_players(region).values('pk'))
+
+        if date is None and (region is None or region.is_ranked):
+            # Precomputed ranks are joined to the player's personal bests
+            scores = query_player_ranked_scores(self.kwargs['pk'], category, region, is_lap)
+
+        else:
+            # Rank the personal bests of every player on every track at once and join the ranks of
+            # the player's own scores
+            track_filters = dict()
+            if is_lap is not None:
+                track_filters['is_lap'] = is_lap
+
+            track_scores = models.Score.objects.filter(
+                pk__in=Subquery(query_personal_bests(category, date, **track_filters))
             )
 
-        # Calculate the rank of each score from the previous query and extract only
-        # the rank of the player's score
-        rank_subquery = models.Score.objects.filter(
-            pk__in=Subquery(track_scores.values('pk'))
-        ).annotate(
-            rank=Window(Rank(), order_by='value')
-        ).order_by(
-            NullIf('player', self.kwargs['pk']).desc()
-        ).values('rank')[:1]
+            if region and region.type != models.RegionTypeChoices.WORLD:
+                track_scores = track_scores.filter(
+                    player__region__ancestor_closures__ancestor=region
+                )
 
-        # Annotate the player's lowest scores with their rank and order by track and lap count
-        scores = models.Score.objects.filter(
-            pk__in=Subquery(player_scores.values('pk'))
-        ).annotate(
-            rank=Subquery(rank_subquery)
-        ).order_by(
-            'track', 'is_lap'
-        )
+            ranked_scores = With(
+                track_scores.annotate(
+                    rank=Window(Rank(), partition_by=['track', 'is_lap'], order_by='value')
+                ).values('pk', 'rank'),
+                name='ranked_scores'
+            )
+
+            scores = ranked_scores.join(
+                models.Score.objects.filter(
+                    pk__in=Subquery(query_personal_bests(category, date, **player_filters))
+                ),
+                pk=ranked_scores.col.id,
+                _join_type=LOUTER,
+            ).with_cte(
+                ranked_scores
+            ).annotate(
+                rank=ranked_scores.col.rank
+            )
+
+        scores = scores.order_by('track', 'is_lap')
 
         return annotate_scores_record_ratio(
             annotate_scores_standard(scores, category, legacy=True),
@@ -73,53 +93,75 @@ class PlayerScoreListView(filters.FilterMixin, generics.ListAPIView):
         )
 
 
-@method_decorator(cache_page(60), name='list')
 @filters.extend_schema_with_filters
-class TrackScoreListView(filters.FilterMixin, generics.ListAPIView):
+class TrackScoreListView(caching.TaggedCacheMixin, row_serializers.RowSerializerMixin,
+                         filters.FilterMixin, generics.ListAPIView):
     serializer_class = serializers.ScoreWithPlayerSerializer
+    row_serializer_class = row_serializers.ScoreWithPlayerRowSerializer
     filter_fields = (
         filters.CategoryFilter(),
         filters.LapModeFilter(),
         filters.DateFilter(),
         filters.RegionFilter(auto=False, required=False),
+        filters.CursorFilter(fields={
+            'value': int,
+            'date': datetime.date.fromisoformat,
+            'id': int,
+        }),
         filters.OffsetFilter(),
         filters.LimitFilter(),
     )
 
+    def get_cache_tags(self):
+        return [
+            caching.PLAYERS_TAG,
+            caching.track_tag(
+                self.kwargs['pk'],
+                self.get_filter_value(filters.LapModeFilter),
+                self.get_filter_value(filters.CategoryFilter),
+                caching.region_tag_id(self.get_filter_value(filters.RegionFilter)),
+            ),
+        ]
+
     def get_queryset(self):
+        category = self.get_filter_value(filters.CategoryFilter)
+        is_lap = self.get_filter_value(filters.LapModeFilter)
+        date = self.get_filter_value(filters.DateFilter)
+        region = self.get_filter_value(filters.RegionFilter)
+
+        if date is None and (region is None or region.is_ranked):
+            # Precomputed ranks allow pages to be read directly from the rank index
+            scores = query_track_ranked_scores(self.kwargs['pk'], category, is_lap, region)
+
+            return annotate_scores_record_ratio(
+                annotate_scores_standard(self.limit(scores), category, legacy=True),
+                category
+            )
+
         scores = models.Score.objects.filter(
             pk__in=Subquery(
-                self.filter(models.Score.objects).filter(
-                    track=self.kwargs['pk'],
-                ).order_by(
-                    'player', 'value'
-                ).distinct(
-                    'player'
-                ).values('pk')
+                query_personal_bests(category, date, track=self.kwargs['pk'], is_lap=is_lap)
             )
         ).order_by(
             'value', 'date'
         ).annotate(rank=Window(Rank(), order_by='value'))
 
-        region = self.get_filter_value(filters.RegionFilter)
-
         if region and region.type != models.RegionTypeChoices.WORLD:
             scores = scores.filter(
-                player__in=Subquery(query_region_players(region).values('pk'))
+                player__region__ancestor_closures__ancestor=region
             )
 
-        category = self.get_filter_value(filters.CategoryFilter)
-
         return annotate_scores_record_ratio(
             annotate_scores_standard(self.limit(scores), category, legacy=True),
             category
         )
 
 
-@method_decorator(cache_page(60), name='list')
 @filters.extend_schema_with_filters
-class TrackTopsListView(filters.FilterMixin, generics.ListAPIView):
+class TrackTopsListView(caching.TaggedCacheMixin, row_serializers.RowSerializerMixin,
+                        filters.FilterMixin, generics.ListAPIView):
     serializer_class = serializers.ScoreWithPlayerSerializer
+    row_serializer_class = row_serializers.ScoreWithPlayerRowSerializer
     filter_fields = (
         filters.CategoryFilter(),
         filters.LapModeFilter(),
@@ -127,16 +169,38 @@ class TrackTopsListView(filters.FilterMixin, generics.ListAPIView):
         filters.RegionFilter(ranked_only=True, auto=False, required=False),
     )
 
+    def get_cache_tags(self):
+        return [
+            caching.PLAYERS_TAG,
+            caching.track_tag(
+                self.kwargs['pk'],
+                self.get_filter_value(filters.LapModeFilter),
+                self.get_filter_value(filters.CategoryFilter),
+                caching.region_tag_id(self.get_filter_value(filters.RegionFilter)),
+            ),
+        ]
+
     def get_queryset(self):
+        category = self.get_filter_value(filters.CategoryFilter)
+        is_lap = self.get_filter_value(filters.LapModeFilter)
+        date = self.get_filter_value(filters.DateFilter)
+        region = self.get_filter_value(filters.RegionFilter)
+
+        if date is None:
+            scores = query_track_ranked_scores(
+                self.kwargs['pk'], category, is_lap, region
+            ).filter(
+                rank__lte=10
+            )
+
+            return annotate_scores_record_ratio(
+                annotate_scores_standard(scores, category, legacy=True),
+                category
+            )
+
         scores = models.Score.objects.filter(
             pk__in=Subquery(
-                self.filter(models.Score.objects).filter(
-                    track=self.kwargs['pk'],
-                ).order_by(
-                    'player', 'value'
-                ).distinct(
-                    'player'
-                ).values('pk')
+                query_personal_bests(category, date, track=self.kwargs['pk'], is_lap=is_lap)
             )
         ).order_by(
             'value', 'date'
@@ -148,25 +212,22 @@ class TrackTopsListView(filters.FilterMixin, generics.ListAPIView):
             rank__lte=10
         )
 
-        region = self.get_filter_value(filters.RegionFilter)
-
         if region and region.type != models.RegionTypeChoices.WORLD:
             scores = scores.filter(
-                player__in=Subquery(query_region_players(region).values('pk'))
+                player__region__ancestor_closures__ancestor=region
             )
 
-        category = self.get_filter_value(filters.CategoryFilter)
-
         return annotate_scores_record_ratio(
             annotate_scores_standard(scores, category, legacy=True),
             category
         )
 
 
-@method_decorator(cache_page(60), name='list')
 @filters.extend_schema_with_filters
-class RecordListView(filters.FilterMixin, generics.ListAPIView):
+class RecordListView(caching.TaggedCacheMixin, row_serializers.RowSerializerMixin,
+                     filters.FilterMixin, generics.ListAPIView):
     serializer_class = serializers.ScoreWithPlayerSerializer
+    row_serializer_class = row_serializers.ScoreWithPlayerRowSerializer
     filter_fields = (
         filters.CategoryFilter(),
         filters.LapModeFilter(required=False),
@@ -174,6 +235,15 @@ class RecordListView(filters.FilterMixin, generics.ListAPIView):
         filters.RegionFilter(auto=False, required=False),
     )
 
+    def get_cache_tags(self):
+        return [
+            caching.PLAYERS_TAG,
+            caching.records_tag(
+                self.get_filter_value(filters.CategoryFilter),
+                caching.region_tag_id(self.get_filter_value(filters.RegionFilter)),
+            ),
+        ]
+
     def get_queryset(self):
         records = self.filter(models.Score.objects).order_by(
             'track', 'is_lap', 'value', 'date'
@@ -185,7 +255,7 @@ class RecordListView(filters.FilterMixin, generics.ListAPIView):
 
         if region and region.type != models.RegionTypeChoices.WORLD:
             records = records.filter(
-                player__in=Subquery(query_region_players(region).values('pk'))
+                player__region__ancestor_closures__ancestor=region
             )
 
         scores = models.Score.objects.filter(
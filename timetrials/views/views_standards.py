@@ -1,15 +1,15 @@
 from rest_framework import generics
 
-from timetrials import filters, models, serializers
+from timetrials import filters, models, serializers, streaming
 
 
-class StandardLevelListView(generics.ListAPIView):
+class StandardLevelListView(streaming.StreamingListMixin, generics.ListAPIView):
     queryset = models.StandardLevel.objects.order_by('value').filter(is_legacy=True)
     serializer_class = serializers.StandardLevelSerializer
 
 
 @filters.extend_schema_with_filters
-class StandardListView(filters.FilterMixin, generics.ListAPIView):
+class StandardListView(streaming.StreamingListMixin, filters.FilterMixin, generics.ListAPIView):
     serializer_class = serializers.StandardSerializer
     filter_fields = (
         filters.CategoryFilter(),
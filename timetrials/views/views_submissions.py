@@ -10,6 +10,7 @@ from drf_spectacular.utils import extend_schema
 from knox.auth import TokenAuthentication
 
 from timetrials import filters, models, serializers
+from timetrials.submissions import accept_score_submissions
 
 
 MAX_PENDING_SUBMISSIONS = 100
@@ -76,6 +77,24 @@ class ScoreSubmissionDestroyView(generics.DestroyAPIView):
         return queryset.filter(status=models.ScoreSubmissionStatus.PENDING)
 
 
+@extend_schema(responses=serializers.ScoreSubmissionSerializer(many=True))
+class ScoreSubmissionAcceptView(generics.GenericAPIView):
+    serializer_class = serializers.ScoreSubmissionAcceptSerializer
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (permissions.IsAdminUser,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        accepted = accept_score_submissions(
+            models.ScoreSubmission.objects.filter(pk__in=serializer.validated_data['ids']),
+            reviewed_by=request.user,
+        )
+
+        return Response(serializers.ScoreSubmissionSerializer(accepted, many=True).data)
+
+
 class EditScoreSubmissionCreateView(generics.CreateAPIView):
     serializer_class = serializers.EditScoreSubmissionSerializer
     authentication_classes = (TokenAuthentication,)